@@ -0,0 +1,247 @@
+"""
+Offline batch submission for dataset generation.
+
+Requests are written to a JSONL file in the OpenAI batch format, submitted to a
+batch backend, polled until they reach a terminal state and the results are read
+back line by line. Two backends are available:
+
+- `OpenAIBatchBackend`: any OpenAI-compatible `/v1/batches` endpoint.
+- `LocalBatchBackend`: a file-based stand-in that answers requests with a
+  responder function, for testing the pipeline without API calls.
+"""
+
+import hashlib
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def strict_json_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Make a pydantic JSON schema acceptable for strict structured outputs."""
+    schema = json.loads(json.dumps(schema))
+
+    def visit(node):
+        if isinstance(node, dict):
+            if node.get("type") == "object":
+                node["additionalProperties"] = False
+                node["required"] = list(node.get("properties", {}).keys())
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    visit(schema)
+    return schema
+
+
+def build_request(custom_id: str, model: str, prompt: str, schema_name: str, schema: Dict[str, Any],
+                  temperature: Optional[float] = None) -> Dict[str, Any]:
+    """Build one batch request line asking for structured output."""
+    body = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": schema_name,
+                "strict": True,
+                "schema": strict_json_schema(schema),
+            },
+        },
+    }
+    if temperature is not None:
+        body["temperature"] = temperature
+
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_requests(requests: Iterable[Dict[str, Any]], path: str) -> int:
+    """Write batch requests to a JSONL file and return how many were written."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def parse_result_line(line: str):
+    """Parse one output line into (custom_id, message content, error)."""
+    result = json.loads(line)
+    custom_id = result["custom_id"]
+
+    if result.get("error"):
+        return custom_id, None, str(result["error"])
+
+    response = result.get("response") or {}
+    if response.get("status_code", 200) != 200:
+        return custom_id, None, f"HTTP {response.get('status_code')}: {response.get('body')}"
+
+    try:
+        return custom_id, response["body"]["choices"][0]["message"]["content"], None
+    except (KeyError, IndexError, TypeError) as e:
+        return custom_id, None, f"Malformed response: {e}"
+
+
+class OpenAIBatchBackend:
+    """Submits batches to an OpenAI-compatible batch API."""
+
+    def __init__(self, client=None):
+        if client is None:
+            import openai
+            client = openai.OpenAI()
+        self.client = client
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, 'rb') as file:
+            input_file = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    def results(self, batch_id: str) -> Iterator[str]:
+        status = self.status(batch_id)
+        for file_id in (status["output_file_id"], status["error_file_id"]):
+            if file_id:
+                for line in self.client.files.content(file_id).text.splitlines():
+                    if line.strip():
+                        yield line
+
+
+class LocalBatchBackend:
+    """File-based stand-in for a batch endpoint.
+
+    Submitted request files are copied into `root/<batch_id>/input.jsonl`. The
+    first status poll answers every request with `responder(body)`, which must
+    return a chat completion response body, and writes `output.jsonl`.
+    """
+
+    def __init__(self, root: str = "./output/batches/local", responder: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.responder = responder or placeholder_responder
+
+    def submit(self, requests_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        batch_dir = self.root / batch_id
+        batch_dir.mkdir()
+        shutil.copyfile(requests_path, batch_dir / "input.jsonl")
+        return batch_id
+
+    def _process(self, batch_dir: Path):
+        with open(batch_dir / "input.jsonl", 'r', encoding='utf-8') as source, \
+                open(batch_dir / "output.jsonl.tmp", 'w', encoding='utf-8') as target:
+            for line in source:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                result = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"]}
+                try:
+                    result["response"] = {"status_code": 200, "body": self.responder(request["body"])}
+                    result["error"] = None
+                except Exception as e:
+                    result["response"] = None
+                    result["error"] = {"code": "responder_error", "message": str(e)}
+                target.write(json.dumps(result, ensure_ascii=False) + "\n")
+        (batch_dir / "output.jsonl.tmp").replace(batch_dir / "output.jsonl")
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        batch_dir = self.root / batch_id
+        if not (batch_dir / "output.jsonl").exists():
+            self._process(batch_dir)
+
+        completed = failed = 0
+        with open(batch_dir / "output.jsonl", 'r', encoding='utf-8') as file:
+            for line in file:
+                if json.loads(line).get("error"):
+                    failed += 1
+                else:
+                    completed += 1
+        return {"status": "completed", "completed": completed, "failed": failed, "total": completed + failed}
+
+    def results(self, batch_id: str) -> Iterator[str]:
+        with open(self.root / batch_id / "output.jsonl", 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield line
+
+
+def placeholder_responder(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer a structured-output request with deterministic placeholder content.
+
+    Fills arrays up to their minItems so the response validates against the
+    requested schema. Strings are derived from a digest of the request and the
+    field path, so different requests and fields get distinct values.
+    """
+    schema = body["response_format"]["json_schema"]["schema"]
+    definitions = schema.get("$defs", {})
+    request_digest = hashlib.sha256(json.dumps(body["messages"], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def fake(node, name="value"):
+        if "$ref" in node:
+            node = definitions[node["$ref"].split("/")[-1]]
+        node_type = node.get("type")
+        if node_type == "object":
+            return {key: fake(value, f"{name}.{key}") for key, value in node.get("properties", {}).items()}
+        if node_type == "array":
+            return [fake(node["items"], f"{name}[{i}]") for i in range(node.get("minItems", 1))]
+        if node_type in ("number", "integer"):
+            return 0
+        if node_type == "boolean":
+            return False
+        field_digest = hashlib.sha256(f"{request_digest}:{name}".encode('utf-8')).hexdigest()[:16]
+        return f"placeholder {name.rsplit('.', 1)[-1]} {field_digest}"
+
+    content = json.dumps(fake(schema), ensure_ascii=False)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def wait_for_batch(backend, batch_id: str, poll_interval: float = 30.0, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Poll a batch until it reaches a terminal status."""
+    started = time.monotonic()
+    while True:
+        status = backend.status(batch_id)
+        print(f"  Batch {batch_id}: {status['status']} ({status.get('completed', 0)}/{status.get('total', 0)} completed, {status.get('failed', 0)} failed)")
+        if status["status"] in TERMINAL_STATUSES:
+            return status
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch_id} did not finish within {timeout:.0f}s")
+        time.sleep(poll_interval)
+
+
+def get_backend(name: str):
+    """Return the batch backend for a name ("openai" or "local")."""
+    if name == "openai":
+        return OpenAIBatchBackend()
+    if name == "local":
+        return LocalBatchBackend()
+    raise ValueError(f"Unknown batch backend: {name}")
@@ -0,0 +1,95 @@
+"""
+Peak-memory benchmark for loading the evaluation dataset.
+
+Each loading strategy runs in a fresh interpreter so its peak RSS is measured
+in isolation:
+
+- "pandas": read_csv, then a second DataFrame built from .tolist() columns (the
+  previous load_eval_data)
+- "arrow": loader.load_eval_frame (streamed record batches, Arrow-backed strings)
+- "stream": loader.iter_eval_batches, touching every batch without keeping it
+
+Usage:
+
+    python benchmarks/loader.py --rows 200000             # synthetic CSV
+    python benchmarks/loader.py --path ./output/generated_questions_and_answers.csv
+"""
+
+import argparse
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STRATEGIES = {
+    "pandas": """
+import pandas as pd
+df = pd.read_csv(PATH)
+frame = pd.DataFrame({"inputs": df["question"].tolist(), "ground_truth": df["answer"].tolist(),
+                      "source_file": df["source_file"].tolist()})
+rows = len(frame)
+""",
+    "arrow": """
+from loader import load_eval_frame
+frame = load_eval_frame(PATH)
+rows = len(frame)
+""",
+    "stream": """
+from loader import iter_eval_batches
+rows = 0
+for batch in iter_eval_batches(PATH):
+    rows += len(batch)
+""",
+}
+
+MEASURE = """
+import json, time
+started = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - started
+from loader import peak_memory
+print(json.dumps(dict(peak_memory(), rows=rows, seconds=round(elapsed, 3))))
+"""
+
+
+def write_synthetic_csv(path: Path, rows: int, answer_chars: int):
+    answer = ("Het antwoord op deze vraag staat in de documentatie. " * (answer_chars // 52 + 1))[:answer_chars]
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["source_file", "question", "answer"])
+        for i in range(rows):
+            writer.writerow([f"files/doc_{i % 500}.md", f"Vraag {i} over onderwerp {i % 97}?", f"{i} {answer}"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare peak memory of evaluation dataset loaders")
+    parser.add_argument("--path", help="Dataset to load (CSV file or shard directory); a synthetic CSV is generated if omitted")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows of the synthetic CSV")
+    parser.add_argument("--answer-chars", type=int, default=1500, help="Answer length of the synthetic CSV")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = str(Path(tmp) / "synthetic.csv")
+            write_synthetic_csv(Path(path), args.rows, args.answer_chars)
+            print(f"Generated {args.rows} synthetic rows ({Path(path).stat().st_size / (1024 * 1024):.0f} MB)")
+
+        for strategy in args.strategies:
+            code = f"PATH = {path!r}\n" + MEASURE.format(body=STRATEGIES[strategy])
+            completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{strategy:>7}: failed ({completed.stderr.strip().splitlines()[-1]})")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{strategy:>7}: peak RSS {result['peak_rss_mb']:8.1f} MB, {result['seconds']:6.2f}s, {result['rows']} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
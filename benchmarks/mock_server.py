@@ -0,0 +1,535 @@
+"""
+Local OpenAI-compatible mock server for offline load tests.
+
+One server stands in for every backend the entry points talk to, so main.py,
+eval.py and eval-langfuse.py can be load-tested without spending tokens:
+
+- POST .../chat/completions (OpenAI, OpenWebUI's /api and /ollama/v1): plain
+  text answers, or, for structured output (a json_schema response_format or
+  a forced tool call), a JSON object generated from the schema, including
+  $refs, arrays of minItems elements and unique text values
+- POST .../api/generate and GET .../api/ps: Ollama model loading, see below
+- the parts of the Langfuse API that eval-langfuse.py uses (prompts, datasets
+  with --dataset-items items, dataset run items and ingestion)
+- GET /stub/stats: request counters, injected faults, latency percentiles and
+  model loads; POST /stub/reset clears them
+
+Chat completions take --latency seconds drawn from --latency-dist (fixed,
+uniform, normal, lognormal or exponential, spread by --latency-sigma). A
+fraction --error-rate of them fails with a 500, and a fraction
+--rate-limit-rate with a 429 carrying a Retry-After of --retry-after seconds.
+
+Like Ollama, the server keeps at most --max-loaded models in memory, evicts
+the least recently used one when another model is requested, and unloads
+models whose keep_alive expired. Loading a model sleeps --load-seconds-per-b
+seconds per billion parameters of its tag (e.g. 70 for llama3.3:70b); the
+default of 0 turns model loading off.
+
+Usage:
+
+    python benchmarks/mock_server.py --port 11434 --latency 0.2 --latency-dist lognormal --rate-limit-rate 0.05
+    python benchmarks/mock_server.py --port 11434 --max-loaded 1 --load-seconds-per-b 0.1
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_KEEP_ALIVE = 300.0
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+_SIZE_RE = re.compile(r":(\d+(?:\.\d+)?)b", re.IGNORECASE)
+_DURATION_RE = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+# Random words for generated text, so generated questions are not near-duplicates of each other
+_WORDS = ("dredging vessel offshore cable trench pipeline rock dumping jack-up crane foundation monopile "
+          "survey bathymetry sediment reclamation dyke breakwater quay harbour channel tender planning "
+          "safety permit hse procedure crew shift maintenance engine hopper cutter suction pump draught "
+          "tide current wave weather window mooring anchor vessel-log report budget contract client "
+          "environment turbidity monitoring sampling laboratory certificate audit inspection training").split()
+
+
+def parse_keep_alive(value) -> Optional[float]:
+    """Seconds to keep a model loaded, None for forever (negative values), as Ollama interprets keep_alive."""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    match = _DURATION_RE.match(str(value).strip())
+    if not match:
+        return DEFAULT_KEEP_ALIVE
+    amount = float(match.group(1))
+    if amount < 0:
+        return None
+    return amount * {"ms": 0.001, "s": 1, None: 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def model_size(model: str) -> float:
+    """Billions of parameters from the model tag, 1 when the tag doesn't say."""
+    match = _SIZE_RE.search(model)
+    return float(match.group(1)) if match else 1.0
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 (nearest rank) of a list of seconds."""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(values)
+    return {f"p{q}": round(ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)], 4)
+            for q in (50, 95, 99)}
+
+
+class LatencyModel:
+    """Draws response latencies with mean `mean` from one of LATENCY_DISTRIBUTIONS."""
+
+    def __init__(self, distribution: str = "fixed", mean: float = 0.01, sigma: float = 0.5,
+                 rng: Optional[random.Random] = None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution!r}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.distribution = distribution
+        self.mean = mean
+        self.sigma = sigma
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            # sigma is the half-width relative to the mean
+            return self.rng.uniform(self.mean * max(0.0, 1 - self.sigma), self.mean * (1 + self.sigma))
+        if self.distribution == "normal":
+            return max(0.0, self.rng.gauss(self.mean, self.mean * self.sigma))
+        if self.distribution == "lognormal":
+            # sigma is the shape; mu is chosen so the mean stays `mean`
+            return self.rng.lognormvariate(math.log(self.mean) - self.sigma ** 2 / 2, self.sigma)
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.mean)
+        return self.mean
+
+
+class StubOllama:
+    """Model residency of the simulated Ollama host."""
+
+    def __init__(self, max_loaded: int = 1, load_seconds_per_b: float = 0.0):
+        self.max_loaded = max(1, max_loaded)
+        self.load_seconds_per_b = load_seconds_per_b
+        # model -> expiry (monotonic time, None = forever), least recently used first
+        self.loaded: "OrderedDict[str, Optional[float]]" = OrderedDict()
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> dict:
+        return self.stats.setdefault(model, {"loads": 0, "unloads": 0, "evictions": 0, "load_time_s": 0.0,
+                                             "requests": 0})
+
+    def _expire(self):
+        now = time.monotonic()
+        for model, expires in list(self.loaded.items()):
+            if expires is not None and expires <= now:
+                del self.loaded[model]
+                self._model_stats(model)["unloads"] += 1
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Load `model` if needed (evicting others) and return the load time in seconds."""
+        if self.load_seconds_per_b <= 0:
+            return 0.0
+        keep = parse_keep_alive(keep_alive)
+        # A single lock: like Ollama, the host loads one model at a time and requests wait for it
+        with self._lock:
+            self._expire()
+            load_time = 0.0
+            if model not in self.loaded:
+                while len(self.loaded) >= self.max_loaded:
+                    evicted, _ = self.loaded.popitem(last=False)
+                    self._model_stats(evicted)["evictions"] += 1
+                load_time = model_size(model) * self.load_seconds_per_b
+                time.sleep(load_time)
+                stats = self._model_stats(model)
+                stats["loads"] += 1
+                stats["load_time_s"] += load_time
+            self.loaded[model] = None if keep is None else time.monotonic() + keep
+            self.loaded.move_to_end(model)
+            return load_time
+
+    def record_request(self, model: str):
+        with self._lock:
+            self._model_stats(model)["requests"] += 1
+
+    def unload(self, model: str):
+        with self._lock:
+            if self.loaded.pop(model, False) is not False:
+                self._model_stats(model)["unloads"] += 1
+
+    def ps(self) -> list:
+        with self._lock:
+            self._expire()
+            now = time.monotonic()
+            return [{
+                "name": model,
+                "model": model,
+                "expires_at": (datetime.now(timezone.utc) + timedelta(seconds=expires - now)).isoformat()
+                if expires is not None else None,
+            } for model, expires in self.loaded.items()]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "loads": sum(stats["loads"] for stats in self.stats.values()),
+                "load_time_s": round(sum(stats["load_time_s"] for stats in self.stats.values()), 3),
+                "models": {model: dict(stats, load_time_s=round(stats["load_time_s"], 3))
+                           for model, stats in self.stats.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.loaded.clear()
+            self.stats.clear()
+
+
+class MockBackend:
+    """State shared by all request handlers: fault injection, counters and the fake Langfuse data."""
+
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, dataset_items: int = 20, seed: Optional[int] = None,
+                 max_loaded: int = 1, load_seconds_per_b: float = 0.0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.latency.rng = self.rng
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.dataset_items = dataset_items
+        self.ollama = StubOllama(max_loaded, load_seconds_per_b)
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.counts = {"chat_requests": 0, "chat_succeeded": 0, "errors_injected": 0, "rate_limited": 0,
+                           "structured": 0, "langfuse_requests": 0, "langfuse_events": 0}
+            self.latencies: List[float] = []
+        self.ollama.reset()
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def fault(self) -> Optional[int]:
+        """Status code of an injected failure for this request, or None to answer it."""
+        with self._lock:
+            draw = self.rng.random()
+        if draw < self.rate_limit_rate:
+            self.count("rate_limited")
+            return 429
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.count("errors_injected")
+            return 500
+        return None
+
+    def text(self, words: int = 12) -> str:
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+            chosen = [self.rng.choice(_WORDS) for _ in range(words)]
+        return f"{' '.join(chosen).capitalize()} ({counter})"
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            return self.latency.sample()
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.counts["chat_succeeded"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return dict(self.counts, elapsed_s=round(elapsed, 3),
+                        rps=round(self.counts["chat_succeeded"] / elapsed, 2) if elapsed else 0.0,
+                        latency_s=percentiles(self.latencies), ollama=self.ollama.snapshot())
+
+
+def example_value(schema: Dict[str, Any], root: Dict[str, Any], backend: MockBackend, index: int = 0) -> Any:
+    """A value that validates against a JSON schema; integers in arrays count up from 0 (e.g. document ids)."""
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            target = target[part]
+        return example_value(target, root, backend, index)
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [option for option in schema[combinator] if option.get("type") != "null"]
+            return example_value(options[0] if options else {"type": "null"}, root, backend, index)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if isinstance(kind, list):
+        kind = next((item for item in kind if item != "null"), "null")
+    if kind == "object":
+        return {name: example_value(spec, root, backend, index) for name, spec in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = schema.get("minItems", 3)
+        if "maxItems" in schema:
+            count = min(max(count, 1), schema["maxItems"])
+        return [example_value(schema.get("items", {}), root, backend, i) for i in range(count)]
+    if kind == "integer":
+        return index
+    if kind == "number":
+        return round(backend.rng.random(), 3)
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    return backend.text()
+
+
+def completion_message(body: Dict[str, Any], backend: MockBackend) -> Dict[str, Any]:
+    """The assistant message: schema-shaped JSON for structured output requests, text otherwise."""
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema")
+    if schema is not None:
+        backend.count("structured")
+        return {"role": "assistant", "content": json.dumps(example_value(schema, schema, backend))}
+
+    tool_choice = body.get("tool_choice")
+    tools = body.get("tools") or []
+    if tools and tool_choice not in (None, "none", "auto"):
+        name = tool_choice.get("function", {}).get("name") if isinstance(tool_choice, dict) else None
+        tool = next((tool for tool in tools if tool.get("function", {}).get("name") == name), tools[0])
+        parameters = tool.get("function", {}).get("parameters", {})
+        backend.count("structured")
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{time.monotonic_ns()}",
+            "type": "function",
+            "function": {"name": tool["function"]["name"],
+                         "arguments": json.dumps(example_value(parameters, parameters, backend))},
+        }]}
+
+    if response_format.get("type") == "json_object":
+        return {"role": "assistant", "content": json.dumps({"answer": backend.text()})}
+    return {"role": "assistant", "content": backend.text(40)}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse their connections
+    protocol_version = "HTTP/1.1"
+    backend: MockBackend
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Optional[dict]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send({"error": "invalid JSON"}, 400)
+            return None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if "/api/public/" in url.path:
+            self._langfuse_get(url.path, parse_qs(url.query))
+        elif url.path.endswith("/api/ps"):
+            self._send({"models": self.backend.ollama.ps()})
+        elif url.path == "/stub/stats":
+            self._send(self.backend.snapshot())
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._body()
+        if body is None:
+            return
+        path = urlsplit(self.path).path
+        if path == "/stub/reset":
+            self.backend.reset()
+            self._send({"reset": True})
+        elif "/api/public/" in path:
+            self._langfuse_post(path, body)
+        elif path.endswith("/chat/completions"):
+            self._chat_completion(body)
+        elif path.endswith("/api/generate"):
+            self._generate(body)
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def _chat_completion(self, body: dict):
+        backend = self.backend
+        model = body.get("model")
+        if not model:
+            self._send({"error": {"message": "model is required", "type": "invalid_request_error"}}, 400)
+            return
+        backend.count("chat_requests")
+        started = time.monotonic()
+
+        status = backend.fault()
+        if status == 429:
+            retry_after = backend.retry_after
+            self._send({"error": {"message": "Rate limit reached (injected)", "type": "rate_limit_error"}}, 429,
+                       {"retry-after": str(max(1, math.ceil(retry_after))),
+                        "retry-after-ms": str(int(retry_after * 1000))})
+            return
+        if status == 500:
+            self._send({"error": {"message": "Internal server error (injected)", "type": "server_error"}}, 500)
+            return
+
+        backend.ollama.ensure_loaded(model, body.get("keep_alive"))
+        backend.ollama.record_request(model)
+        time.sleep(backend.sample_latency())
+        message = completion_message(body, backend)
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        backend.record_latency(time.monotonic() - started)
+        self._send({
+            "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _generate(self, body: dict):
+        model = body.get("model")
+        if not model:
+            self._send({"error": "model is required"}, 400)
+            return
+        if parse_keep_alive(body.get("keep_alive")) == 0:
+            self.backend.ollama.unload(model)
+            self._send({"model": model, "response": "", "done": True, "done_reason": "unload"})
+            return
+        load_time = self.backend.ollama.ensure_loaded(model, body.get("keep_alive"))
+        self._send({"model": model, "response": "", "done": True, "load_duration": int(load_time * 1e9)})
+
+    def _langfuse_get(self, path: str, query: Dict[str, List[str]]):
+        backend = self.backend
+        backend.count("langfuse_requests")
+        if "/v2/prompts/" in path:
+            name = path.rsplit("/", 1)[-1]
+            self._send({"type": "text", "name": name, "version": 1, "config": {}, "labels": ["production"],
+                        "tags": [], "prompt": "You are a helpful assistant. Answer using the knowledge base."})
+        elif "/v2/datasets/" in path:
+            name = path.rsplit("/", 1)[-1]
+            self._send({"id": f"dataset-{name}", "name": name, "projectId": "mock", "createdAt": _now(),
+                        "updatedAt": _now()})
+        elif path.endswith("/dataset-items"):
+            name = query.get("datasetName", ["dataset"])[0]
+            page = int(query.get("page", ["1"])[0])
+            limit = int(query.get("limit", ["50"])[0])
+            first = (page - 1) * limit
+            items = [{
+                "id": f"item-{i}", "status": "ACTIVE", "datasetId": f"dataset-{name}", "datasetName": name,
+                "input": f"Question {i}: what does the procedure say about {_WORDS[i % len(_WORDS)]}?",
+                "expectedOutput": f"The procedure describes {_WORDS[i % len(_WORDS)]} in section {i}.",
+                "metadata": {"source_file": f"files/doc_{i % 5}.md"}, "createdAt": _now(), "updatedAt": _now(),
+            } for i in range(first, min(first + limit, backend.dataset_items))]
+            self._send({"data": items, "meta": {"page": page, "limit": limit, "totalItems": backend.dataset_items,
+                                                "totalPages": max(1, math.ceil(backend.dataset_items / limit))}})
+        else:
+            self._send({})
+
+    def _langfuse_post(self, path: str, body: dict):
+        backend = self.backend
+        backend.count("langfuse_requests")
+        if path.endswith("/ingestion"):
+            events = body.get("batch", [])
+            backend.count("langfuse_events", len(events))
+            self._send({"successes": [{"id": event.get("id", ""), "status": 201} for event in events], "errors": []},
+                       207)
+        elif path.endswith("/dataset-run-items"):
+            self._send({"id": f"run-item-{time.monotonic_ns()}", "datasetRunId": f"run-{body.get('runName')}",
+                        "datasetRunName": body.get("runName", ""), "datasetItemId": body.get("datasetItemId", ""),
+                        "traceId": body.get("traceId") or "", "observationId": body.get("observationId"),
+                        "createdAt": _now(), "updatedAt": _now()})
+        else:
+            self._send({})
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many concurrent clients connect at once during load tests
+    request_queue_size = 512
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.01, latency_dist: str = "fixed",
+                 latency_sigma: float = 0.5, **options) -> MockServer:
+    """Start the mock server in a daemon thread; port 0 picks a free port (see server.server_address)."""
+    backend = MockBackend(LatencyModel(latency_dist, latency, latency_sigma), **options)
+    handler = type("MockHandler", (Handler,), {"backend": backend})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Mock server options, shared with the benchmarks that start one."""
+    parser.add_argument("--latency", type=float, default=0.01, help="Mean seconds per chat completion")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Spread of the latency: shape for lognormal, relative for uniform and normal")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of chat completions that fail with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of chat completions answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of injected 429s, in seconds")
+    parser.add_argument("--max-loaded", type=int, default=1, help="Models that fit in memory at the same time")
+    parser.add_argument("--load-seconds-per-b", type=float, default=0.0,
+                        help="Model load time per billion parameters of the model tag (0 = no loading)")
+    parser.add_argument("--dataset-items", type=int, default=20, help="Items of every mocked Langfuse dataset")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and fault draws")
+
+
+def server_options(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "latency": args.latency, "latency_dist": args.latency_dist, "latency_sigma": args.latency_sigma,
+        "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate, "retry_after": args.retry_after,
+        "max_loaded": args.max_loaded, "load_seconds_per_b": args.load_seconds_per_b,
+        "dataset_items": args.dataset_items, "seed": args.seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock server (with Ollama and Langfuse endpoints)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = start_server(args.host, args.port, **server_options(args))
+    print(f"Mock server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
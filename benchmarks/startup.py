@@ -0,0 +1,117 @@
+"""
+Startup-time benchmark for the entry points.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+reports the wall time of the import plus the most expensive modules it pulled
+in (cumulative microseconds, as reported by importtime). Results are written to
+./output/benchmarks/startup.json; with --baseline the run fails when an entry
+point got slower than the baseline by more than --tolerance.
+
+Usage:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --modules eval run_evaluation --top 15
+    python benchmarks/startup.py --baseline output/benchmarks/startup_baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ["eval", "run_evaluation", "main"]
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def measure(module: str, repeat: int):
+    """Import a module `repeat` times in fresh interpreters; returns wall times and the importtime profile of the last run."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    wall_times = []
+    profile = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        wall_times.append(time.perf_counter() - started)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+            return None, {}, error
+        profile = parse_importtime(completed.stderr)
+    return wall_times, profile, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import cost of the entry points")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreter runs per module; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="Number of most expensive imports to show per module")
+    parser.add_argument("--output", default="./output/benchmarks/startup.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for module in args.modules:
+        wall_times, profile, error = measure(module, args.repeat)
+        if error is not None:
+            print(f"{module}: import failed ({error})")
+            results[module] = {"error": error}
+            continue
+
+        top = sorted(profile.items(), key=lambda item: item[1][1], reverse=True)
+        # The module itself is the root of the import tree, skip it in the breakdown
+        top = [(name, cumulative) for name, (_, cumulative) in top if name != module][:args.top]
+        results[module] = {
+            "wall_s": round(statistics.median(wall_times), 4),
+            "modules_imported": len(profile),
+            "top_imports_us": dict(top),
+        }
+
+        print(f"\n{module}: {results[module]['wall_s'] * 1000:.0f} ms (median of {args.repeat}), {len(profile)} modules imported")
+        for name, cumulative in top:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for module, result in results.items():
+            before = baseline.get(module, {}).get("wall_s")
+            if before and "wall_s" in result and result["wall_s"] > before * (1 + args.tolerance):
+                regressions.append(f"{module}: {before * 1000:.0f} ms -> {result['wall_s'] * 1000:.0f} ms")
+        if regressions:
+            print("\nStartup regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo startup regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
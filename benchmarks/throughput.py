@@ -0,0 +1,202 @@
+"""
+End-to-end throughput benchmark of the entry points against the mock server.
+
+Starts benchmarks/mock_server.py in-process and runs every target in a fresh
+interpreter whose OpenAI, OpenWebUI, Ollama and Langfuse endpoints all point at
+it, so nothing leaves the machine and no tokens are spent:
+
+- "main": main.py on a synthetic markdown corpus of --files files
+- "eval": the prediction phase of eval.py (ModelEvaluator.predict for every
+  configured model, as run_all_evaluations runs it) on --rows rows; the
+  MLflow scoring needs a tracking server and the toxicity classifier
+- "eval-full": eval.py itself, with MLflow tracking to a local file store
+- "eval-langfuse": eval-langfuse.py on a mocked dataset of --items items
+
+Per target it reports requests/sec and p50/p95/p99 latency as seen by the
+callers (from the shared request scheduler, so including throttling and
+retries), the server-side counts of injected faults, and the peak RSS of the
+process. Results are written to ./output/benchmarks/throughput.json.
+
+Usage:
+
+    python benchmarks/throughput.py
+    python benchmarks/throughput.py --targets main eval --latency 0.3 --latency-dist lognormal --rate-limit-rate 0.05
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+import mock_server
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from scheduler import latency_percentiles  # noqa: E402
+
+EVAL_PREDICT = """
+from concurrent.futures import ThreadPoolExecutor
+from eval import ModelEvaluator
+
+evaluator = ModelEvaluator()
+eval_data = evaluator.load_eval_data()
+questions = eval_data["inputs"].tolist()
+with ThreadPoolExecutor(max_workers=evaluator.model_concurrency) as pool:
+    list(pool.map(lambda config: evaluator.predict(config, questions), evaluator.get_model_configurations()))
+"""
+
+
+def write_corpus(directory: Path, files: int):
+    directory.mkdir(parents=True, exist_ok=True)
+    paragraph = ("The dredging vessel follows the approved work method statement. Before each shift the crew "
+                 "checks the permits, the weather window and the survey results of the previous day. ")
+    for i in range(files):
+        sections = "\n\n".join(f"## Section {j}\n\n{paragraph * 4}" for j in range(3))
+        (directory / f"doc_{i:04d}.md").write_text(f"# Procedure {i}\n\n{sections}\n", encoding='utf-8')
+
+
+def write_eval_dataset(path: Path, rows: int):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["source_file", "question", "answer"])
+        for i in range(rows):
+            writer.writerow([f"files/doc_{i % 25}.md", f"What does procedure {i} require before a shift?",
+                             f"Procedure {i} requires checking the permits and the weather window."])
+
+
+def prepare(target: str, workdir: Path, base_url: str, args: argparse.Namespace):
+    """Command and environment of a target; inputs are written to workdir."""
+    env = {
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_OLLAMA_URL": f"{base_url}/ollama/v1",
+        "LANGFUSE_HOST": base_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-mock",
+        "LANGFUSE_SECRET_KEY": "sk-mock",
+        "GENERATION_CACHE": "0",
+        "EVAL_PREDICTION_CACHE": "0",
+        "TOXICITY_CACHE": "0",
+        "JUDGE_CACHE": "0",
+        "EVAL_RESULTS_PATH": str(workdir / "output" / "evaluations" / "results.sqlite"),
+        "MLFLOW_TRACKING_URI": (workdir / "mlruns").as_uri(),
+    }
+    (workdir / "output" / "evaluations").mkdir(parents=True, exist_ok=True)
+
+    if target == "main":
+        write_corpus(workdir / "files", args.files)
+        env.update(FILES_DIR="files", OPENAI_MODEL="gpt-4.1-nano")
+        return [sys.executable, str(ROOT / "main.py")], env
+    if target in ("eval", "eval-full"):
+        write_eval_dataset(workdir / "dataset.csv", args.rows)
+        # eval.py's models are served by OpenWebUI
+        env.update(EVAL_DATA_PATH=str(workdir / "dataset.csv"), OPENAI_BASE_URL=f"{base_url}/api")
+        if target == "eval":
+            return [sys.executable, "-c", f"import sys; sys.path.insert(0, {str(ROOT)!r})\n" + EVAL_PREDICT], env
+        return [sys.executable, str(ROOT / "eval.py")], env
+    if target == "eval-langfuse":
+        env.update(OPENAI_BASE_URL=f"{base_url}/api", EVAL_LANGFUSE_MAX_ITEMS=str(args.items))
+        return [sys.executable, str(ROOT / "eval-langfuse.py")], env
+    raise ValueError(f"Unknown target {target}")
+
+
+def server_call(base_url: str, path: str, post: bool = False) -> dict:
+    request = Request(base_url + path, data=b"{}" if post else None, headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def run_target(target: str, base_url: str, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        command, env = prepare(target, workdir, base_url, args)
+        metrics_path = workdir / "scheduler.json"
+        env = dict(os.environ, **env, SCHEDULER_METRICS_PATH=str(metrics_path))
+        log_path = workdir / "output.log"
+
+        server_call(base_url, "/stub/reset", post=True)
+        started = time.perf_counter()
+        with open(log_path, 'w', encoding='utf-8') as log:
+            process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 returns the resource usage of this child only
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - started
+        server = server_call(base_url, "/stub/stats")
+
+        result = {
+            "exit_code": process.returncode,
+            "wall_s": round(wall, 3),
+            # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+            "peak_rss_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+            "server": server,
+        }
+        if metrics_path.exists():
+            client = json.loads(metrics_path.read_text(encoding='utf-8'))
+            stats = client["metrics"].values()
+            succeeded = sum(entry["succeeded"] for entry in stats)
+            result.update(
+                requests=succeeded,
+                failed=sum(entry["failed"] for entry in stats),
+                retries=sum(entry["retries"] for entry in stats),
+                rps=round(succeeded / wall, 2) if wall else 0.0,
+                latency=latency_percentiles(client["latencies"]),
+            )
+        if process.returncode != 0 or not metrics_path.exists():
+            result["log_tail"] = log_path.read_text(encoding='utf-8', errors='replace').splitlines()[-20:]
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the entry points against the local mock server")
+    parser.add_argument("--targets", nargs="+", default=["main", "eval", "eval-langfuse"],
+                        choices=["main", "eval", "eval-full", "eval-langfuse"])
+    parser.add_argument("--files", type=int, default=50, help="Markdown files of the main.py corpus")
+    parser.add_argument("--rows", type=int, default=200, help="Dataset rows for eval.py")
+    parser.add_argument("--items", type=int, default=10, help="Langfuse dataset items per eval-langfuse.py experiment")
+    parser.add_argument("--output", default="./output/benchmarks/throughput.json", help="Where to write the results")
+    mock_server.add_arguments(parser)
+    args = parser.parse_args(argv)
+    args.dataset_items = max(args.dataset_items, args.items)
+
+    server = mock_server.start_server(**mock_server.server_options(args))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Mock server on {base_url}: {args.latency_dist} latency, mean {args.latency}s, "
+          f"{args.error_rate:.0%} errors, {args.rate_limit_rate:.0%} rate limited")
+
+    results = {}
+    try:
+        for target in args.targets:
+            print(f"\n{target}: running...")
+            result = results[target] = run_target(target, base_url, args)
+            if "requests" not in result or result["exit_code"] != 0:
+                print(f"{target}: failed with exit code {result['exit_code']}")
+                for line in result.get("log_tail", []):
+                    print(f"  | {line}")
+                if "requests" not in result:
+                    continue
+            latency = result["latency"]
+            server_stats = result["server"]
+            print(f"{target}: {result['requests']} requests in {result['wall_s']:.1f}s = {result['rps']:.1f} req/s, "
+                  f"latency p50 {latency['p50_s']:.3f}s / p95 {latency['p95_s']:.3f}s / p99 {latency['p99_s']:.3f}s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB")
+            print(f"  {result['retries']} retries, {result['failed']} failed; server injected "
+                  f"{server_stats['rate_limited']} 429s and {server_stats['errors_injected']} 500s")
+    finally:
+        server.shutdown()
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({"settings": mock_server.server_options(args), "results": results}, file, indent=2)
+    print(f"\nResults saved to {args.output}")
+    return 0 if all(result["exit_code"] == 0 for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
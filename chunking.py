@@ -0,0 +1,135 @@
+"""
+Token-budgeted chunking of markdown documents.
+
+Documents are split on markdown headings first; sections that are still larger
+than the token budget are split on paragraphs, then on lines. Small neighbouring
+pieces are packed back together so each chunk uses as much of the budget as
+possible.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+HEADING_RE = re.compile(r"^#{1,6}\s")
+FENCE_RE = re.compile(r"^(```|~~~)")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken missing, or its encoding file can't be downloaded (offline runners)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, otherwise estimate ~4 characters per token."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_sections(content: str) -> List[str]:
+    """Split markdown into sections that each start at a heading (headings in code fences are ignored)."""
+    sections = []
+    current = []
+    in_fence = False
+
+    for line in content.splitlines(keepends=True):
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and HEADING_RE.match(line) and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a piece of text that exceeds the budget on paragraphs, then lines, then characters."""
+    for separator in ("\n\n", "\n"):
+        parts = [part + separator for part in text.split(separator) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                if count_tokens(part) > max_tokens:
+                    pieces.extend(_split_oversized(part, max_tokens))
+                else:
+                    pieces.append(part)
+            return pieces
+
+    # A single huge line: fall back to fixed-size character windows
+    window = max_tokens * 4
+    return [text[i:i + window] for i in range(0, len(text), window)]
+
+
+def _pack(pieces: List[str], max_tokens: int) -> List[str]:
+    """Greedily merge consecutive pieces while they fit in the budget."""
+    chunks = []
+    current = ""
+    current_tokens = 0
+
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current += piece
+        current_tokens += piece_tokens
+
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def chunk_markdown(content: str, max_tokens: int, tokens: Optional[int] = None) -> List[str]:
+    """Split a markdown document into chunks of at most max_tokens tokens.
+
+    `tokens` is the token count of the whole document, when the caller already has it.
+    """
+    if (tokens if tokens is not None else count_tokens(content)) <= max_tokens:
+        return [content]
+
+    pieces = []
+    for section in split_sections(content):
+        if count_tokens(section) <= max_tokens:
+            pieces.append(section)
+            continue
+
+        # Repeat the section heading on every piece so chunks keep their context
+        lines = section.splitlines(keepends=True)
+        heading = lines[0] if HEADING_RE.match(lines[0]) else ""
+        body = section[len(heading):]
+        budget = max(max_tokens - count_tokens(heading), 1)
+        for sub_chunk in _pack(_split_oversized(body, budget), budget):
+            pieces.append(heading + sub_chunk)
+
+    return _pack(pieces, max_tokens)
+
+
+def allocate_questions(sizes: List[int], total: int) -> List[int]:
+    """Distribute `total` questions over chunks proportionally to their sizes.
+
+    Uses the largest remainder method so the allocation always sums to `total`.
+    Chunks that end up with zero questions should be skipped.
+    """
+    weight = sum(sizes)
+    if weight == 0:
+        sizes = [1] * len(sizes)
+        weight = len(sizes)
+
+    quotas = [total * size / weight for size in sizes]
+    allocation = [int(quota) for quota in quotas]
+    remaining = total - sum(allocation)
+
+    by_remainder = sorted(range(len(sizes)), key=lambda i: (quotas[i] - allocation[i], sizes[i]), reverse=True)
+    for i in by_remainder[:remaining]:
+        allocation[i] += 1
+    return allocation
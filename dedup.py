@@ -0,0 +1,157 @@
+"""
+Near-duplicate question detection with MinHash and locality-sensitive hashing.
+
+Every question is reduced to a MinHash signature of its character shingles. The
+signature is split into bands; two questions that agree on all rows of at least
+one band become candidates, and candidates are confirmed by their estimated
+Jaccard similarity. Only one representative per cluster is indexed, so each new
+row costs a handful of dictionary lookups instead of a comparison against every
+row seen so far.
+"""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = _NON_WORD_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def shingles(text: str, k: int = 4) -> set:
+    """Character k-grams of the normalized text."""
+    text = normalize(text)
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def optimal_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) with bands * rows <= num_perm whose LSH threshold is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        # The similarity at which the candidate probability curve is steepest
+        lsh_threshold = (1 / bands) ** (1 / rows)
+        distance = abs(lsh_threshold - threshold)
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """Computes MinHash signatures with a fixed family of random hash functions."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 4, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        values = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+             for s in shingles(text, self.shingle_size)),
+            dtype=np.uint64
+        )
+        # a, b and the shingle hashes are < 2^32, so a * x + b cannot overflow 64 bits
+        hashed = (np.outer(self.a, values) + self.b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+class DedupIndex:
+    """Incremental near-duplicate index over generated questions.
+
+    Call `filter(rows)` for every batch of rows before writing them: rows whose
+    question is a near-duplicate of an earlier one are dropped and recorded in
+    the cluster of the question they duplicate.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 4, field: str = 'question'):
+        self.threshold = threshold
+        self.field = field
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows_per_band = optimal_bands(num_perm, threshold)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+        self.clusters: List[Dict[str, Any]] = []
+        self.rows_seen = 0
+        self.rows_dropped = 0
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            start = band * self.rows_per_band
+            yield band, signature[start:start + self.rows_per_band].tobytes()
+
+    def find(self, text: str) -> Tuple[Optional[int], float, np.ndarray]:
+        """Return (cluster id, similarity, signature) of the best matching cluster, if any."""
+        signature = self.hasher.signature(text)
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best_id, best_similarity = None, 0.0
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id, best_similarity, signature
+
+    def add(self, row: Dict[str, str]) -> bool:
+        """Index a row; returns False if it is a near-duplicate of an indexed row."""
+        self.rows_seen += 1
+        cluster_id, similarity, signature = self.find(row[self.field])
+
+        if cluster_id is not None:
+            self.rows_dropped += 1
+            self.clusters[cluster_id]["duplicates"].append({
+                "source_file": row.get("source_file"),
+                self.field: row[self.field],
+                "similarity": round(similarity, 3),
+            })
+            return False
+
+        cluster_id = len(self._signatures)
+        self._signatures.append(signature)
+        self.clusters.append({
+            "representative": {"source_file": row.get("source_file"), self.field: row[self.field]},
+            "duplicates": [],
+        })
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(cluster_id)
+        return True
+
+    def filter(self, rows: Iterable[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Return the rows that are not near-duplicates, indexing them as we go."""
+        return [row for row in rows if self.add(row)]
+
+    def report(self) -> Dict[str, Any]:
+        """Summary of the collapsed clusters, largest first."""
+        collapsed = [cluster for cluster in self.clusters if cluster["duplicates"]]
+        collapsed.sort(key=lambda cluster: len(cluster["duplicates"]), reverse=True)
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.hasher.num_perm,
+            "bands": self.bands,
+            "rows_per_band": self.rows_per_band,
+            "rows_seen": self.rows_seen,
+            "rows_dropped": self.rows_dropped,
+            "clusters": collapsed,
+        }
+
+    def write_report(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=2)
@@ -0,0 +1,86 @@
+"""
+Streaming discovery and lazy reading of the markdown corpus.
+
+`iter_documents` walks a directory tree with `os.scandir` and yields matching
+files one at a time, so generation can start as soon as the first file is
+found instead of after the whole tree has been listed. Directories are visited
+in sorted order, which keeps the output order deterministic.
+"""
+
+import mmap
+import os
+from pathlib import Path, PurePosixPath
+from typing import Iterator, Sequence
+
+# Files larger than this are decoded straight from a memory map instead of read()
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+def _matches(relative_path: str, patterns: Sequence[str]) -> bool:
+    """Match a tree-relative path against glob patterns.
+
+    Patterns without a slash (e.g. "*.md") match the file name at any depth;
+    patterns with a slash (e.g. "drafts/**") match the full relative path.
+    """
+    path = PurePosixPath(relative_path)
+    for pattern in patterns:
+        if "/" in pattern:
+            if path.full_match(pattern):
+                return True
+        elif path.match(pattern):
+            return True
+    return False
+
+
+def iter_documents(root: str, include: Sequence[str] = ("*.md",), exclude: Sequence[str] = ()) -> Iterator[Path]:
+    """Recursively yield files under root that match include and none of exclude.
+
+    Excluded directories are pruned without being scanned. Files with a size of
+    zero bytes are skipped from their directory entry, without opening them.
+    """
+    root = Path(root)
+    stack = [root]
+    # "drafts/**" should prune the drafts directory itself, not just its contents
+    directory_exclude = list(exclude) + [pattern[:-3] for pattern in exclude if pattern.endswith("/**")]
+
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except (FileNotFoundError, PermissionError, NotADirectoryError):
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative = Path(entry.path).relative_to(root).as_posix()
+            if entry.is_dir(follow_symlinks=False):
+                if not _matches(relative, directory_exclude):
+                    subdirectories.append(Path(entry.path))
+            elif entry.is_file() and _matches(relative, include) and not _matches(relative, exclude):
+                if entry.stat().st_size == 0:
+                    continue
+                yield Path(entry.path)
+
+        # Push in reverse so subdirectories are visited in sorted order
+        stack.extend(reversed(subdirectories))
+
+
+def read_document(path: str, mmap_threshold: int = MMAP_THRESHOLD) -> str:
+    """Read a UTF-8 document, decoding large files directly from a memory map."""
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return ""
+        if size < mmap_threshold:
+            return file.read().decode('utf-8')
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # Decoding from a memoryview avoids an intermediate bytes copy of the file
+            with memoryview(mapped) as view:
+                return str(view, 'utf-8')
+
+
+def is_blank(content: str) -> bool:
+    """True for empty or whitespace-only content, without copying it like strip() does."""
+    return not content or content.isspace()
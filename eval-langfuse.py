@@ -1,17 +1,46 @@
 from langfuse import Langfuse
 from langfuse.decorators import observe, langfuse_context
-import requests
+import asyncio
+import httpx
 import os
 import uuid
 import json
-from mlflow.metrics.genai import EvaluationExample, faithfulness
 import datetime
+import functools
+import hashlib
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from scheduler import get_scheduler
+from sampling import stratified_sample
+from residency import ModelResidency, group_by_model
+from tracking import LangfuseBuffer
+from http_client import close_http_client, get_http_client
+from grid import ConcurrencyLimits, Progress, format_duration
+from cache import DiskCache, hash_key
 
 load_dotenv()
 
 # init
 langfuse = Langfuse()
+# Traces are uploaded in the background while the next items run; this only holds items back when too many wait
+langfuse_buffer = LangfuseBuffer.from_env([langfuse, langfuse_context.client_instance])
+
+# Items evaluated per experiment, drawn as a stratified sample by the source_file in the item metadata (0 = all)
+MAX_ITEMS = int(os.getenv("EVAL_LANGFUSE_MAX_ITEMS", "100"))
+SEED = int(os.getenv("EVAL_SEED", "0"))
+JUDGE_MODEL = os.getenv("OPENAI_EVAL_MODEL", "qwen3:30b-a3b")
+# Run all generations of a model back to back and judge them afterwards, instead of interleaving models per item
+GROUP_BY_MODEL = os.getenv("OLLAMA_GROUP_BY_MODEL", "1") != "0"
+# Dataset items in flight at the same time, over all experiments of the grid
+ITEM_CONCURRENCY = int(os.getenv("EVAL_LANGFUSE_CONCURRENCY", "16"))
+# Requests in flight per model and per endpoint, see grid.py
+limits = ConcurrencyLimits.from_env()
+# Persistent judge verdicts, so repeated sweeps only pay for new generations
+JUDGE_CACHE_ENABLED = os.getenv("JUDGE_CACHE", "1") != "0"
+JUDGE_CACHE_PATH = os.getenv("JUDGE_CACHE_PATH", "./output/cache/judge.sqlite")
+JUDGE_CACHE_MAX_ENTRIES = int(os.getenv("JUDGE_CACHE_MAX_ENTRIES", "1000000"))
+JUDGE_CACHE_MAX_MB = float(os.getenv("JUDGE_CACHE_MAX_MB", "512"))
 
 models = [
     "gemma3:4b",
@@ -40,97 +69,93 @@ print("Cartesian product of models and temperatures:")
 for model, temperature, prompt in cartesian_product:
     print(f"Model: {model}, Temperature: {temperature}, Prompt: {prompt.name}")
 
-def helpfulness_llm_as_a_judge(query: str, generation: str, ground_truth: str):
-    body = {
-      "model": os.getenv("OPENAI_EVAL_MODEL", "qwen3:30b-a3b"),
-      "messages": [
-        {
-          "role": "user",
-          "content": [
-            {
-              "type": "text",
-              "text": f"Identify the helpfulness of a response by analyzing the relationship between the query, answer, and expected answer. \n\nStart with reasoning and end with the response. Consider references to external elements and other aspects when determining helpfulness.\n\n# Steps\n\n1. **Understand the input components**: Clearly differentiate between the query, the given answer, and the expected answer.\n2. **Analyze the Answer**: \n   - Check if the answer directly addresses the query.\n   - Evaluate the accuracy and relevance of the response in relation to the expected answer.\n3. **Consider External Elements**: \n   - Assess if the answer appropriately refers to external elements, providing added value or clarification.\n4. **Formulate Reasoning**: \n   - Base your reasoning on the alignment between the answer and the expected answer, while noting any helpful references to external information.\n5. **Determine Helpfulness**: \n   - Conclude how helpful the answer is based on the analysis, supported by your reasoning.\n\n# Output Format\n\nThe output should be structured into two parts:\n- **Reasoning**: A detailed explanation of the analysis.\n- **Response**: A conclusion stating the helpfulness of the answer.\n\n# Examples\n\n**Example 1:**\n\n- **Query**: \"What is the capital of France?\"\n- **Answer**: \"The capital of France is Paris.\"\n- **Expected Answer**: \"Paris.\"\n\n**Reasoning**: The given answer correctly identifies the capital of France as Paris, which matches the expected answer. No additional references are used, but the information is accurate and directly addresses the query.\n\n**Response**: The answer is helpful.\n\n**Example 2:**\n\n- **Query**: \"What are some health benefits of eating apples?\"\n- **Answer**: \"Apples are good for your heart, may help prevent cancer, and boost your immunity. They are also linked to a lower risk of diabetes.\"\n- **Expected Answer**: \"Apples help in improving heart health and boosting immunity.\"\n\n**Reasoning**: The answer provides an expanded list of health benefits compared to the expected answer, which adds value. It correctly includes the benefits mentioned in the expected answer and introduces relevant additional information, increasing helpfulness by referencing other significant health benefits.\n\n**Response**: The answer is very helpful.\n\n# Notes\n\n- Ensure reasoning is coherent and fully supports the response.\n- Consider each answer\"s context and specificity to the query when evaluating helpfulness.\n- External references should enhance the response\"s value or clarity.\\n\\nInput:\\nQuery:\\n```\\n{query}\\n```\\n\\nGeneration:\\n```\\n{generation}\\n```\\n\\nGround truth:\\n```\\n{ground_truth}\\n```\\n\\n\\n\\n"
-            }
-          ]
-        }
-      ],
-      "response_format": {
-        "type": "json_schema",
-        "json_schema": {
-          "name": "helpfulness_detection",
-          "strict": True,
-          "schema": {
-            "type": "object",
-            "properties": {
-              "reasoning": {
-                "type": "string",
-                "description": "The reasoning behind the helpfulness score."
-              },
-              "score": {
-                "type": "number",
-                "description": "A float value representing the helpfulness score between 0 and 1."
-              }
-            },
-            "required": [
-              "reasoning",
-              "score"
-            ],
-            "additionalProperties": True
-          }
-        }
-      },
-      "temperature": 0.6,
-      "max_completion_tokens": 2048,
-      "top_p": 0.95,
-      "frequency_penalty": 0,
-      "presence_penalty": 0
+async def post_chat_completion(api_endpoint: str, body: dict, timeout=None):
+    """POST a chat completion with the pooled HTTP client, through the shared scheduler.
+
+    Rate limits for the endpoint/model are enforced before sending, and 429s,
+    5xx responses and timeouts are retried with backoff (honoring Retry-After).
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"
     }
+    # Serialized once; retries resend the same bytes
+    content = json.dumps(body).encode("utf-8")
+    client = get_http_client()
 
-    api_endpoint = os.getenv("OPENAI_OLLAMA_URL", "http://lxc-ai01:3000/ollama/v1")  + "/chat/completions"
-    try:
-        # Make the API request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"
-        }
-        
-        response = requests.post(
-            api_endpoint,
-            json=body,
-            headers=headers,
-            stream=False,
-            timeout=120
-        )
-        
-        response.raise_for_status()
-        
-        # Handle non-streaming response
-        result = response.json()["choices"][0]["message"]["content"]
-        print("Raw result:", result)
+    async def send():
+        # The slot is only held while the request is on the wire, not while it waits for its rate limit or a retry
+        async with limits.slot(api_endpoint, body["model"]):
+            return await client.post(api_endpoint, content, headers=headers, timeout=timeout)
+
+    tokens = len(content) // 4 + body.get("max_completion_tokens", 0)
+    return await get_scheduler().arun(send, endpoint=api_endpoint, model=body["model"], tokens=tokens)
+
+# Criteria of the judge and their rubrics; JUDGE_RUBRICS_PATH points to a JSON object {"criterion": "rubric", ...}
+# The defaults are the texts of the former separate correctness and helpfulness judge prompts, verbatim
+DEFAULT_RUBRICS = {
+    "correctness": "Evaluate the correctness of the generation on a continuous scale from 0 to 1. A generation can be considered correct (Score: 1) if it includes all the key facts from the ground truth and if every fact presented in the generation is factually supported by the ground truth or common sense.\\n\\nExample:\\nQuery: Can eating carrots improve your vision?\\nGeneration: Yes, eating carrots significantly improves your vision, especially at night. This is why people who eat lots of carrots never need glasses. Anyone who tells you otherwise is probably trying to sell you expensive eyewear or does not want you to benefit from this simple, natural remedy. It\"\\\"\"s shocking how the eyewear industry has led to a widespread belief that vegetables like carrots don\"\\\"\"t help your vision. People are so gullible to fall for these money-making schemes.\\nGround truth: Well, yes and no. Carrots won\"\\\"\"t improve your visual acuity if you have less than perfect vision. A diet of carrots won\"\\\"\"t give a blind person 20/20 vision. But, the vitamins found in the vegetable can help promote overall eye health. Carrots contain beta-carotene, a substance that the body converts to vitamin A, an important nutrient for eye health. An extreme lack of vitamin A can cause blindness. Vitamin A can prevent the formation of cataracts and macular degeneration, the world\"\\\"\"s leading cause of blindness. However, if your vision problems aren\"\\\"\"t related to vitamin A, your vision won\"\\\"\"t change no matter how many carrots you eat.\\nScore: 0.1\\nReasoning: While the generation mentions that carrots can improve vision, it fails to outline the reason for this phenomenon and the circumstances under which this is the case. The rest of the response contains misinformation and exaggerations regarding the benefits of eating carrots for vision improvement. It deviates significantly from the more accurate and nuanced explanation provided in the ground truth.",
+    "helpfulness": "Identify the helpfulness of a response by analyzing the relationship between the query, answer, and expected answer. \n\nStart with reasoning and end with the response. Consider references to external elements and other aspects when determining helpfulness.\n\n# Steps\n\n1. **Understand the input components**: Clearly differentiate between the query, the given answer, and the expected answer.\n2. **Analyze the Answer**: \n   - Check if the answer directly addresses the query.\n   - Evaluate the accuracy and relevance of the response in relation to the expected answer.\n3. **Consider External Elements**: \n   - Assess if the answer appropriately refers to external elements, providing added value or clarification.\n4. **Formulate Reasoning**: \n   - Base your reasoning on the alignment between the answer and the expected answer, while noting any helpful references to external information.\n5. **Determine Helpfulness**: \n   - Conclude how helpful the answer is based on the analysis, supported by your reasoning.\n\n# Output Format\n\nThe output should be structured into two parts:\n- **Reasoning**: A detailed explanation of the analysis.\n- **Response**: A conclusion stating the helpfulness of the answer.\n\n# Examples\n\n**Example 1:**\n\n- **Query**: \"What is the capital of France?\"\n- **Answer**: \"The capital of France is Paris.\"\n- **Expected Answer**: \"Paris.\"\n\n**Reasoning**: The given answer correctly identifies the capital of France as Paris, which matches the expected answer. No additional references are used, but the information is accurate and directly addresses the query.\n\n**Response**: The answer is helpful.\n\n**Example 2:**\n\n- **Query**: \"What are some health benefits of eating apples?\"\n- **Answer**: \"Apples are good for your heart, may help prevent cancer, and boost your immunity. They are also linked to a lower risk of diabetes.\"\n- **Expected Answer**: \"Apples help in improving heart health and boosting immunity.\"\n\n**Reasoning**: The answer provides an expanded list of health benefits compared to the expected answer, which adds value. It correctly includes the benefits mentioned in the expected answer and introduces relevant additional information, increasing helpfulness by referencing other significant health benefits.\n\n**Response**: The answer is very helpful.\n\n# Notes\n\n- Ensure reasoning is coherent and fully supports the response.\n- Consider each answer\"s context and specificity to the query when evaluating helpfulness.\n- External references should enhance the response\"s value or clarity.",
+}
+# Langfuse score names of the default criteria, as reported by the former separate judge calls
+SCORE_NAMES = {"correctness": "score", "helpfulness": "helpfulness_score"}
+
+
+def load_rubrics(path=None):
+    """The judge criteria: the JSON object at `path` (or JUDGE_RUBRICS_PATH), else DEFAULT_RUBRICS."""
+    path = path or os.getenv("JUDGE_RUBRICS_PATH")
+    if not path:
+        return dict(DEFAULT_RUBRICS)
+    with open(path, encoding="utf-8") as file:
+        rubrics = json.load(file)
+    if not isinstance(rubrics, dict) or not rubrics or not all(isinstance(text, str) for text in rubrics.values()):
+        raise ValueError(f"{path} must contain a JSON object mapping criterion names to rubric texts")
+    return rubrics
+
+
+RUBRICS = load_rubrics()
+
+judge_cache = DiskCache(
+    JUDGE_CACHE_PATH,
+    max_entries=JUDGE_CACHE_MAX_ENTRIES,
+    max_bytes=int(JUDGE_CACHE_MAX_MB * 1024 * 1024)
+) if JUDGE_CACHE_ENABLED else None
 
-        result_json = json.loads(result)
-        print("Parsed result JSON:", result_json)
-        if "score" in result_json:
-            return result_json["reasoning"], float(result_json["score"])
-        else:
-            print("Score not found in response:", result_json)
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"API request failed: {e}")
-        print("Response content:", response.text if 'response' in locals() else "No response")
-        return None
 
-def score_llm_as_a_judge(query: str, generation: str, ground_truth: str):
-    body = {
-      "model": os.getenv("OPENAI_EVAL_MODEL", "qwen3:30b-a3b"),
+def judge_request_body(query: str, generation: str, ground_truth: str, rubrics: dict) -> dict:
+    """One judge request for all criteria; the schema asks for reasoning and a score per criterion."""
+    criteria = "\n\n".join(f"## {name}\n{rubric}" for name, rubric in rubrics.items())
+    prompt = (
+        f"Evaluate the generation for the query against the ground truth on each of the following {len(rubrics)} "
+        f"criteria. For every criterion, reason step by step first and then assign a score between 0 and 1.\n\n"
+        f"# Criteria\n\n{criteria}\n\n"
+        f"# Input\n\nQuery:\n```\n{query}\n```\n\nGeneration:\n```\n{generation}\n```\n\n"
+        f"Ground truth:\n```\n{ground_truth}\n```"
+    )
+    criterion_schema = {
+        "type": "object",
+        "properties": {
+            "reasoning": {
+                "type": "string",
+                "description": "The reasoning behind the score, explaining how the generation compares to the ground truth."
+            },
+            "score": {
+                "type": "number",
+                "description": "The score between 0 and 1 for this criterion."
+            }
+        },
+        "required": ["reasoning", "score"],
+        "additionalProperties": False
+    }
+    return {
+      "model": JUDGE_MODEL,
       "messages": [
         {
           "role": "user",
           "content": [
             {
               "type": "text",
-              "text": f"Evaluate the correctness of the generation on a continuous scale from 0 to 1. A generation can be considered correct (Score: 1) if it includes all the key facts from the ground truth and if every fact presented in the generation is factually supported by the ground truth or common sense.\\n\\nExample:\\nQuery: Can eating carrots improve your vision?\\nGeneration: Yes, eating carrots significantly improves your vision, especially at night. This is why people who eat lots of carrots never need glasses. Anyone who tells you otherwise is probably trying to sell you expensive eyewear or does not want you to benefit from this simple, natural remedy. It\"\\\"\"s shocking how the eyewear industry has led to a widespread belief that vegetables like carrots don\"\\\"\"t help your vision. People are so gullible to fall for these money-making schemes.\\nGround truth: Well, yes and no. Carrots won\"\\\"\"t improve your visual acuity if you have less than perfect vision. A diet of carrots won\"\\\"\"t give a blind person 20/20 vision. But, the vitamins found in the vegetable can help promote overall eye health. Carrots contain beta-carotene, a substance that the body converts to vitamin A, an important nutrient for eye health. An extreme lack of vitamin A can cause blindness. Vitamin A can prevent the formation of cataracts and macular degeneration, the world\"\\\"\"s leading cause of blindness. However, if your vision problems aren\"\\\"\"t related to vitamin A, your vision won\"\\\"\"t change no matter how many carrots you eat.\\nScore: 0.1\\nReasoning: While the generation mentions that carrots can improve vision, it fails to outline the reason for this phenomenon and the circumstances under which this is the case. The rest of the response contains misinformation and exaggerations regarding the benefits of eating carrots for vision improvement. It deviates significantly from the more accurate and nuanced explanation provided in the ground truth.\\n\\n\\n\\nInput:\\nQuery:\\n```\\n{query}\\n```\\n\\nGeneration:\\n```\\n{generation}\\n```\\n\\nGround truth:\\n```\\n{ground_truth}\\n```\\n\\n\\n\\nThink step by step."
+              "text": prompt
             }
           ]
         }
@@ -138,24 +163,12 @@ def score_llm_as_a_judge(query: str, generation: str, ground_truth: str):
       "response_format": {
         "type": "json_schema",
         "json_schema": {
-          "name": "llm_score_system",
+          "name": "llm_multi_criteria_judge",
           "strict": True,
           "schema": {
             "type": "object",
-            "properties": {
-                "reasoning": {
-                "type": "string",
-                "description": "The reasoning behind the score assigned, explaining how the actual answer compares to the expected answer."
-              },
-              "score": {
-                "type": "number",
-                "description": "The score assigned based on the quality of the actual answer compared to the expected answer."
-              }
-            },
-            "required": [
-              "score",
-              "reasoning"
-            ],
+            "properties": {name: criterion_schema for name in rubrics},
+            "required": list(rubrics),
             "additionalProperties": False
           }
         }
@@ -167,23 +180,30 @@ def score_llm_as_a_judge(query: str, generation: str, ground_truth: str):
       "presence_penalty": 0
     }
 
+def judge_key(query: str, generation: str, ground_truth: str, rubrics: dict) -> str:
+    """Key of a stored verdict: judge model, rubric hash, query, generation and ground truth."""
+    # The request without its inputs covers the rubrics, the prompt around them, the schema and the decoding parameters
+    rubric_hash = hashlib.sha256(json.dumps(judge_request_body("", "", "", rubrics), sort_keys=True).encode('utf-8')).hexdigest()
+    return hash_key(JUDGE_MODEL, rubric_hash, query, generation, ground_truth)
+
+async def score_llm_as_a_judge(query: str, generation: str, ground_truth: str, rubrics=None):
+    """Judge a generation on all criteria in one request, or reuse the stored verdict.
+
+    Returns {criterion: (reasoning, score)} for the criteria the judge scored,
+    or None when the request failed or the response isn't valid JSON.
+    """
+    rubrics = rubrics or RUBRICS
+    key = judge_key(query, generation, ground_truth, rubrics) if judge_cache is not None else None
+    if key is not None:
+        cached = judge_cache.get(key)
+        if cached is not None:
+            return {name: (reasoning, score) for name, (reasoning, score) in cached.items()}
+    body = judge_request_body(query, generation, ground_truth, rubrics)
+
     api_endpoint = os.getenv("OPENAI_OLLAMA_URL", "http://lxc-ai01:3000/ollama/v1")  + "/chat/completions"
     try:
         # Make the API request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"
-        }
-        
-        response = requests.post(
-            api_endpoint,
-            json=body,
-            headers=headers,
-            stream=False,
-            timeout=120
-        )
-        
-        response.raise_for_status()
+        response = await post_chat_completion(api_endpoint, body)
         
         # Handle non-streaming response
         result = response.json()["choices"][0]["message"]["content"]
@@ -191,19 +211,46 @@ def score_llm_as_a_judge(query: str, generation: str, ground_truth: str):
 
         result_json = json.loads(result)
         print("Parsed result JSON:", result_json)
-        if "score" in result_json:
-            return result_json["reasoning"], float(result_json["score"])
-        else:
-            print("Score not found in response:", result_json)
-            return None
-            
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"API request failed: {e}")
-        print("Response content:", response.text if 'response' in locals() else "No response")
+        print("Response content:", e.response.text if isinstance(e, httpx.HTTPStatusError) else "No response")
+        return None
+    except ValueError as e:
+        print(f"Judge response is not valid JSON: {e}")
         return None
 
+    judged = {}
+    for name in rubrics:
+        verdict = result_json.get(name) if isinstance(result_json, dict) else None
+        try:
+            judged[name] = (str(verdict.get("reasoning", "")), float(verdict["score"]))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            # Missing or unparseable scores count as not judged
+            print(f"Score for {name} not found in response:", result_json)
+    # Incomplete verdicts aren't stored, so the missing criteria are judged again next time
+    if key is not None and len(judged) == len(rubrics):
+        judge_cache.set(key, judged)
+    return judged
+
+async def judge_generation(item, user_content: str, output: str, score):
+    """Judge a generation and report each criterion with score(name=, value=, data_type=, comment=)."""
+    # None when the judge failed even after retries; skip those scores
+    judged = await score_llm_as_a_judge(item.input, output, item.expected_output)
+    for name, (reasoning, value) in (judged or {}).items():
+        print(f"{name} for {user_content}: {value}")
+        score(
+          name=SCORE_NAMES.get(name, name),
+          value=value,
+          data_type="NUMERIC",  # optional, inferred if not provided
+          comment=reasoning
+        )
+
+def observation_scorer(trace_id: str, observation_id: str):
+    """score(name=, value=, ...) for an observation; queued by the Langfuse client, which uploads in the background."""
+    return functools.partial(langfuse.score, trace_id=trace_id, observation_id=observation_id)
+
 @observe(capture_input=False)
-def eval_llm_as_a_judge(
+async def eval_llm_as_a_judge(
     user_content,
     system_content=None,
     stream=False,
@@ -214,6 +261,7 @@ def eval_llm_as_a_judge(
     variables=None,
     api_endpoint=None,
     item = None,
+    judge_queue = None,
 ):
     """
     Make a custom API call with configurable parameters
@@ -230,6 +278,7 @@ def eval_llm_as_a_judge(
         files (list): List of file objects with id, name, type, status
         variables (dict): Variables to pass to the API
         api_endpoint (str): The API endpoint URL
+        judge_queue (list): Collects the generation for judging later instead of judging it right away
     """
     
     # Generate chat_id if not provided
@@ -281,53 +330,28 @@ def eval_llm_as_a_judge(
     
     try:
         # Make the API request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"
-        }
-        
         start = datetime.datetime.now()
-        response = requests.post(
-            api_endpoint,
-            json=payload,
-            headers=headers,
-            stream=stream,
-            timeout=120
-        )
+        response = await post_chat_completion(api_endpoint, payload)
         end = datetime.datetime.now()
         
-        if response.status_code != 200:
-            print(f"Error: Received status code {response.status_code} from API")
-            print(f"Response content: {response.json()}")
-            return None
-        
         # Handle non-streaming response
         json = response.json()
         output = json["choices"][0]["message"]["content"]
 
-        llm_as_a_judge_reason, llm_as_a_judge_score = score_llm_as_a_judge(item.input, output, item.expected_output)
-        print(f"Score for {user_content}: {llm_as_a_judge_score}")
-
-        llm_as_a_judge_helpfulreason, llm_as_a_judge_helpfulscore = score_llm_as_a_judge(item.input, output, item.expected_output)
-        print(f"Helpfulness score for {user_content}: {llm_as_a_judge_helpfulscore}")
-
-        langfuse_context.score_current_observation(
-          name="score",
-          value=llm_as_a_judge_score,
-          data_type="NUMERIC",  # optional, inferred if not provided
-          comment=llm_as_a_judge_reason
-        )
-        langfuse_context.score_current_observation(
-          name="helpfulness_score",
-          value=llm_as_a_judge_helpfulscore,
-          data_type="NUMERIC",  # optional, inferred if not provided
-          comment=llm_as_a_judge_helpfulreason
-        )
-        langfuse_context.score_current_observation(
+        # The ids of the current observation, taken here because queued generations are judged outside of it
+        trace_id = langfuse_context.get_current_trace_id()
+        observation_id = langfuse_context.get_current_observation_id()
+        score = observation_scorer(trace_id, observation_id)
+        if judge_queue is None:
+            await judge_generation(item, user_content, output, score)
+        else:
+            # Judged once all generations of this model are done, see run_experiments()
+            judge_queue.append((trace_id, observation_id, item, user_content, output))
+        score(
           name="duration",
           value=(end - start).total_seconds(),
           data_type="NUMERIC",  # optional, inferred if not provided
-          comment="Score from LLM as a judge for correctness",
+          comment="Duration of the generation request in seconds",
         )
         langfuse_context.update_current_observation(model=model, start_time=start, end_time=end, usage_details={
             "input": json["usage"]["prompt_tokens"],
@@ -336,48 +360,166 @@ def eval_llm_as_a_judge(
 
         return output
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"API request failed: {e}")
         return None
 
-# @observe(capture_input=False, capture_output=False, as_type="generation")
-def run_experiment(experiment_name: str, system_prompt: str, model: str, temperature: float):
-  dataset = langfuse.get_dataset("wiki_questions")
+@asynccontextmanager
+async def observe_item(item, **run):
+  """item.observe() whose closing dataset run link, a blocking request, is sent from a worker thread."""
+  observation = item.observe(**run)
+  trace_id = observation.__enter__()
+  try:
+    yield trace_id
+  except BaseException as e:
+    if not await asyncio.to_thread(observation.__exit__, type(e), e, e.__traceback__):
+      raise
+  else:
+    await asyncio.to_thread(observation.__exit__, None, None, None)
+
+async def load_items():
+  """The dataset items every experiment evaluates."""
+  dataset = await asyncio.to_thread(langfuse.get_dataset, "wiki_questions")
+
+  items = dataset.items
+  if MAX_ITEMS and len(items) > MAX_ITEMS:
+    # The same seed gives every experiment the same sample, so their scores stay comparable
+    strata = [str(item.metadata.get("source_file", "")) if isinstance(item.metadata, dict) else "" for item in items]
+    items = [items[i] for i in stratified_sample(strata, MAX_ITEMS, seed=SEED)]
+    print(f"Evaluating a stratified sample of {len(items)} of {len(dataset.items)} items")
+  return items
+
+async def run_item(experiment, item, item_slots, progress=None, judge_queue=None):
+  """Evaluate one dataset item in one (experiment_name, system_prompt, model, temperature) experiment.
+
+  Returns False when the item failed; the error is printed instead of raised,
+  so one bad response doesn't abort the other items of the grid.
+  """
+  experiment_name = experiment[0]
+  try:
+    await evaluate_item(experiment, item, item_slots, judge_queue)
+  except Exception as e:
+    print(f"❌ {experiment_name}: item {item.id} failed: {e!r}")
+    return False
+  finally:
+    if progress is not None:
+      progress.advance()
+  return True
 
-  for index, item in enumerate(dataset.items):
-    if index > 99:
-      print(f"Skipping item {index} as it exceeds the limit of 50 items.")
-      break
+async def evaluate_item(experiment, item, item_slots, judge_queue=None):
+  """The evaluation of run_item(), which raises when it fails."""
+  experiment_name, system_prompt, model, temperature = experiment
+  async with item_slots:
+    await langfuse_buffer.wait_for_room()
     # item.observe() returns a trace_id that can be used to add custom evaluations later
-    # it also automatically links the trace to the experiment run
-    with item.observe(run_name=experiment_name,
-                      run_description=f"Model: {model}, Temperature: {temperature}", run_metadata={
+    # it also automatically links the trace to the experiment run. Every item runs in its own
+    # task, and so in its own copy of the Langfuse context
+    async with observe_item(item, run_name=experiment_name,
+                            run_description=f"Model: {model}, Temperature: {temperature}", run_metadata={
         "model": model,
         "temperature": temperature,
         "experiment_name": experiment_name
     }) as trace_id:
       print(f"Running evaluation for: {item.input} with trace ID: {trace_id}")
- 
+
       # run application, pass input and system prompt
-      _ = eval_llm_as_a_judge(item.input, system_prompt,
-                                     item=item,
-                                     model=model,
-                                     temperature=temperature,
-                                     )
+      _ = await eval_llm_as_a_judge(item.input, system_prompt,
+                                    item=item,
+                                    model=model,
+                                    temperature=temperature,
+                                    judge_queue=judge_queue,
+                                    )
+
+async def run_grid(experiments, items, progress, judge_queue=None):
+  """Run all items of all experiments concurrently.
+
+  Up to EVAL_LANGFUSE_CONCURRENCY items are in flight; the requests they send
+  are capped per model and per endpoint by `limits`. The items are started
+  item by item across the experiments, so the slots are spread over all models
+  instead of filling up with the first experiment.
+  """
+  item_slots = asyncio.Semaphore(ITEM_CONCURRENCY)
+  succeeded = await asyncio.gather(*(run_item(experiment, item, item_slots, progress, judge_queue)
+                                     for item in items for experiment in experiments))
+  failed = succeeded.count(False)
+  if failed:
+    print(f"⚠️  {failed} of {len(succeeded)} item(s) failed")
+  return failed
+
+async def run_experiments(experiments, items):
+  """Run (experiment_name, system_prompt, model, temperature) experiments grouped by model.
 
-      langfuse_context.flush()
-      langfuse.flush()
-  langfuse_context.update_current_observation(input=experiment_name, model=model)
+  The experiments of one model run concurrently, and the models one after the
+  other, with the judge calls for all generations at the end, so the Ollama
+  host swaps models once per group instead of twice per item.
+  """
+  residency = ModelResidency.from_env()
+  judge_queue = []
+  progress = Progress.from_env("Generated", len(experiments) * len(items))
+  for model, group in group_by_model(experiments, lambda experiment: experiment[2]):
+    await asyncio.to_thread(residency.switch_to, model)
+    print(f"Running {len(group)} experiment(s) with model: {model}")
+    await run_grid(group, items, progress, judge_queue=judge_queue)
+
+  await asyncio.to_thread(residency.switch_to, JUDGE_MODEL)
+  print(f"Judging {len(judge_queue)} generations with {JUDGE_MODEL}")
+  slots = asyncio.Semaphore(ITEM_CONCURRENCY)
+  progress = Progress.from_env("Judged", len(judge_queue))
+
+  async def judge(trace_id, observation_id, item, user_content, output):
+    try:
+      async with slots:
+        await langfuse_buffer.wait_for_room()
+        await judge_generation(item, user_content, output, observation_scorer(trace_id, observation_id))
+    except Exception as e:
+      # Like run_item(), a failed verdict doesn't stop the other generations from being judged
+      print(f"❌ Judging item {item.id} failed: {e!r}")
+      return False
+    finally:
+      progress.advance()
+    return True
+
+  judged = await asyncio.gather(*(judge(*queued) for queued in judge_queue))
+  if judged.count(False):
+    print(f"⚠️  {judged.count(False)} of {len(judged)} generation(s) could not be judged")
+  return residency
+
+async def main(experiments):
+  try:
+    items = await load_items()
+    if GROUP_BY_MODEL:
+      return await run_experiments(experiments, items)
+    print(f"Running {len(experiments)} experiment(s) concurrently")
+    await run_grid(experiments, items, Progress.from_env("Evaluated", len(experiments) * len(items)))
+    return None
+  finally:
+    await close_http_client()
 
 if __name__ == "__main__":
     
-    for (model, temperature, prompt) in cartesian_product:
-        experiment_name = f"jdn_wiki-{model}-{prompt.name}-{temperature}-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-        print(f"Running experiment with model: {model}")
-        run_experiment(experiment_name, prompt.prompt, model, temperature)
-        langfuse_context.flush()
-        langfuse.flush()
-    
-    print(f"Running experiment: {experiment_name}")
-    langfuse_context.flush()
-    langfuse.flush()
\ No newline at end of file
+    experiments = [
+        (f"jdn_wiki-{model}-{prompt.name}-{temperature}-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+         prompt.prompt, model, temperature)
+        for (model, temperature, prompt) in cartesian_product
+    ]
+    started = time.monotonic()
+    try:
+        residency = asyncio.run(main(experiments))
+        
+        models = {model for _, _, model, _ in experiments}
+        print(f"Ran {len(experiments)} experiment(s) with {len(models)} model(s) in {format_duration(time.monotonic() - started)}")
+        print("Request scheduler:")
+        get_scheduler().print_metrics()
+        if residency is not None:
+            print("Model residency:")
+            residency.print_metrics()
+        if judge_cache is not None:
+            stats = judge_cache.stats()
+            print(f"Judge cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['evictions']} eviction(s), "
+                  f"{stats['entries']} entries stored")
+            judge_cache.close()
+    finally:
+        # The only blocking flush of the run, also when it failed
+        langfuse_buffer.close()
+        print("Langfuse upload:")
+        langfuse_buffer.print_stats()
@@ -1,17 +1,40 @@
-import mlflow
-import openai
+from __future__ import annotations
+
 import os
-import pandas as pd
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import json
+import hashlib
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import threading
+import time
+from scheduler import get_scheduler
+from cache import DiskCache, hash_key
+from toxicity import get_scorer, toxicity_metric
+from loader import load_eval_frame, peak_memory
+from sampling import SequentialRanking, stratified_order, token_f1
+from results_store import ResultsStore
+from tracking import TRACKING_SHUTDOWN_TIMEOUT, get_tracking_writer
+
+# mlflow, openai and pandas are imported on first use: they take seconds to import,
+# which would otherwise slow down every entry point, even its argument checks
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Load environment variables
 load_dotenv()
 
-mlflow.set_tracking_uri('http://localhost:8111')
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", 'http://localhost:8111')
+
+@lru_cache(maxsize=1)
+def load_mlflow():
+    """Import mlflow and point it at the tracking server, once per process."""
+    import mlflow
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    return mlflow
 
 system_prompt = """
 Provide concise and professional responses to internal queries, adhering to the guidelines for Jan De Nul Group's JdnGPT assistant.
@@ -56,37 +79,82 @@ Yes, offshore installation follows these main steps: [List Steps]. For detailed
 - When providing answers, ALWAYS mention the source file from which the information was derived!
 """
 
+# Number of models evaluated at the same time, and of questions answered concurrently per model
+EVAL_MODEL_CONCURRENCY = int(os.getenv("EVAL_MODEL_CONCURRENCY", "3"))
+EVAL_ROW_CONCURRENCY = int(os.getenv("EVAL_ROW_CONCURRENCY", "4"))
+
+# Persistent store of model answers, so metric changes don't re-query the models
+EVAL_PREDICTION_CACHE_ENABLED = os.getenv("EVAL_PREDICTION_CACHE", "1") != "0"
+EVAL_PREDICTION_CACHE_PATH = os.getenv("EVAL_PREDICTION_CACHE_PATH", "./output/cache/predictions.sqlite")
+EVAL_PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("EVAL_PREDICTION_CACHE_MAX_ENTRIES", "1000000"))
+EVAL_PREDICTION_CACHE_MAX_MB = float(os.getenv("EVAL_PREDICTION_CACHE_MAX_MB", "2048"))
+
+# Durable per-row results; EVAL_RESUME=<run id> or "latest" continues a run and skips rows already scored
+EVAL_RESULTS_PATH = os.getenv("EVAL_RESULTS_PATH", "./output/evaluations/results.sqlite")
+EVAL_RESUME = os.getenv("EVAL_RESUME", "")
+
+# Rows per Arrow record batch when streaming the dataset
+EVAL_LOAD_BATCH_SIZE = int(os.getenv("EVAL_LOAD_BATCH_SIZE", "10000"))
+
+# Sequential evaluation: rows are evaluated in stratified rounds until the model ranking is settled
+EVAL_SEQUENTIAL = os.getenv("EVAL_SEQUENTIAL", "0") == "1"
+EVAL_SEQUENTIAL_BATCH = int(os.getenv("EVAL_SEQUENTIAL_BATCH", "25"))
+EVAL_MIN_ROWS = int(os.getenv("EVAL_MIN_ROWS", "50"))
+EVAL_MAX_ROWS = int(os.getenv("EVAL_MAX_ROWS")) if os.getenv("EVAL_MAX_ROWS") else None
+EVAL_CONFIDENCE = float(os.getenv("EVAL_CONFIDENCE", "0.95"))
+EVAL_CI_PRECISION = float(os.getenv("EVAL_CI_PRECISION", "0.02"))
+EVAL_SEED = int(os.getenv("EVAL_SEED", "0"))
+
+# OpenWebUI knowledge collection the evaluated models answer from
+KNOWLEDGE_FILES = [
+    {
+        "id": "5124e1a2-9908-4b7a-8945-6fb63f2cea6e",
+        "name": "Wiki",
+        "type": "collection",
+        "status": "processed"
+    }
+]
+
 class ModelEvaluator:
     """Evaluation system for testing multiple models against generated Q&A data."""
     
-    def __init__(self, csv_path: str = "./output/generated_questions_and_answers.csv"):
+    def __init__(self, csv_path: str = os.getenv("EVAL_DATA_PATH", "./output/generated_questions_and_answers.csv"),
+                 model_concurrency: int = EVAL_MODEL_CONCURRENCY, row_concurrency: int = EVAL_ROW_CONCURRENCY):
         self.csv_path = csv_path
+        self.model_concurrency = max(1, model_concurrency)
+        self.row_concurrency = max(1, row_concurrency)
+        self.prediction_cache = None
         self.output_dir = Path("./output/evaluations")
         self.output_dir.mkdir(exist_ok=True)
+        self.results_store = ResultsStore(EVAL_RESULTS_PATH)
+        self.run_id = None
+        self._summary_lock = threading.Lock()
         
         # Check if OpenAI API key is set
         if not os.getenv('OPENAI_API_KEY'):
             raise ValueError("OPENAI_API_KEY environment variable not set")
     
     def load_eval_data(self) -> pd.DataFrame:
-        """Load and transform the CSV data into MLflow evaluation format."""
-        print(f"Loading evaluation data from {self.csv_path}")
+        """Load the data generated by main.py (CSV or jsonl/parquet shards) in MLflow evaluation format.
         
-        # Read the CSV generated by main.py
-        df = pd.read_csv(self.csv_path)
-        print(f"Loaded {len(df)} question-answer pairs")
+        The dataset is streamed in Arrow record batches and stored with
+        Arrow-backed string columns, so answers are held once in compact
+        buffers instead of as one Python object per cell.
+        """
+        print(f"Loading evaluation data from {self.csv_path}")
         
-        # Transform to MLflow evaluation format
-        eval_data = pd.DataFrame({
-            "inputs": df["question"].tolist(),
-            "ground_truth": df["answer"].tolist(),
-            "source_file": df["source_file"].tolist()
-        })
+        eval_data = load_eval_frame(self.csv_path, batch_size=EVAL_LOAD_BATCH_SIZE)
+        print(f"Loaded {len(eval_data)} question-answer pairs "
+              f"({eval_data.memory_usage(deep=True).sum() / (1024 * 1024):.1f} MB, peak memory {peak_memory()})")
         
         return eval_data
     
     def get_model_configurations(self) -> List[Dict[str, Any]]:
-        """Define the models to evaluate."""
+        """Define the models to evaluate.
+        
+        An optional "params" dict (e.g. {"temperature": 0.2}) is passed to the
+        chat completion request and is part of the prediction store key.
+        """
         return [
             {
                 "name": "qwen3:14b",
@@ -116,141 +184,389 @@ class ModelEvaluator:
             # }
         ]
     
-    def evaluate_model(self, model_config: Dict[str, Any], eval_data: pd.DataFrame) -> Dict[str, Any]:
-        """Evaluate a single model using MLflow."""
+    def open_prediction_cache(self) -> Optional[DiskCache]:
+        """Open the persistent prediction store, or return None when it is disabled."""
+        if not EVAL_PREDICTION_CACHE_ENABLED:
+            return None
+        return DiskCache(
+            EVAL_PREDICTION_CACHE_PATH,
+            max_entries=EVAL_PREDICTION_CACHE_MAX_ENTRIES,
+            max_bytes=int(EVAL_PREDICTION_CACHE_MAX_MB * 1024 * 1024)
+        )
+    
+    def prediction_key(self, model: str, system_prompt: str, question: str, params: Dict[str, Any]) -> str:
+        """Key of a stored prediction: model, system prompt hash, question and decoding parameters."""
+        prompt_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+        return hash_key(model, prompt_hash, question, json.dumps(params, sort_keys=True), json.dumps(KNOWLEDGE_FILES, sort_keys=True))
+    
+    def predict(self, model_config: Dict[str, Any], questions: List[str],
+                on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> pd.DataFrame:
+        """Answer the evaluation questions, reusing stored predictions.
+        
+        Only questions without a stored prediction are sent to the model, by
+        `row_concurrency` threads. Every request goes through the shared
+        scheduler, so evaluation respects the endpoint's rate limits and
+        retries throttled calls with backoff. Returns a frame with the
+        `outputs`, the `latency` of the original request and whether the
+        prediction came `from_cache`, in question order. `on_result(position,
+        prediction)` is called as soon as each prediction is available.
+        """
+        import openai
+        import pandas as pd
+        
+        model = model_config["model"]
+        system_prompt = model_config["system_prompt"]
+        params = model_config.get("params", {})
+        client = openai.OpenAI(max_retries=0)
+        endpoint = str(client.base_url)
+        scheduler = get_scheduler()
+        
+        def answer(question: str) -> str:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": question},
+                ],
+                extra_body={"files": KNOWLEDGE_FILES},
+                **params
+            )
+            return response.choices[0].message.content
+        
+        def predict_one(position: int) -> Dict[str, Any]:
+            question = questions[position]
+            key = self.prediction_key(model, system_prompt, question, params)
+            cached = self.prediction_cache.get(key) if self.prediction_cache is not None else None
+            if cached is not None:
+                prediction = {"outputs": cached["answer"], "latency": cached["latency"], "from_cache": True}
+            else:
+                started = time.monotonic()
+                output = scheduler.run(lambda: answer(question), endpoint=endpoint, model=model,
+                                       tokens=(len(system_prompt) + len(question)) // 4)
+                latency = time.monotonic() - started
+                if self.prediction_cache is not None:
+                    self.prediction_cache.set(key, {"answer": output, "latency": latency})
+                prediction = {"outputs": output, "latency": latency, "from_cache": False}
+            if on_result is not None:
+                on_result(position, prediction)
+            return prediction
+        
+        # Answer rows concurrently; map() keeps the answers in question order
+        with ThreadPoolExecutor(max_workers=self.row_concurrency, thread_name_prefix=f"eval-{model}") as pool:
+            return pd.DataFrame(list(pool.map(predict_one, range(len(questions)))),
+                                columns=["outputs", "latency", "from_cache"])
+    
+    def evaluate_model(self, model_config: Dict[str, Any], eval_data: pd.DataFrame,
+                       rows_available: Optional[int] = None) -> Dict[str, Any]:
+        """Evaluate a single model using MLflow.
+        
+        Every answer is written to the results store as soon as it arrives,
+        and its metric scores once MLflow scored the batch. Rows the current
+        run already scored (see EVAL_RESUME) are skipped. The metrics are
+        computed from all scored rows of the model in the store and contain
+        bootstrap confidence intervals (`<metric>/ci_low`, `<metric>/ci_high`)
+        for the per-row metrics and the number of rows the evaluation used.
+        """
+        import pandas as pd
+        
+        mlflow = load_mlflow()
         model_name = model_config["name"]
         model = model_config["model"]
         system_prompt = model_config["system_prompt"]
+        store = self.results_store
+        rows_available = rows_available if rows_available is not None else len(eval_data)
         
         print(f"\nEvaluating model: {model_name}")
         
+        scored = store.scored_questions(self.run_id, model_name)
+        pending = eval_data[~eval_data["inputs"].isin(scored)].reset_index(drop=True) if scored else eval_data
+        if scored:
+            print(f"⏭️  {model_name}: {len(eval_data) - len(pending)}/{len(eval_data)} row(s) already scored in run {self.run_id}")
+        if len(pending) == 0:
+            if not scored:
+                return self.failed_result(model_config, rows_available, "No rows to evaluate")
+            return self.stored_result(model_name)
+        
         with mlflow.start_run(run_name=f"eval_{model_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}") as run:
+            store.start_model(self.run_id, model_name, model, run.info.run_id, rows_available)
+            # Params and metrics are sent in batches by a background thread, not one request each from here
+            tracker = get_tracking_writer()
+            
             # Log model parameters
-            mlflow.log_param("model_name", model_name)
-            mlflow.log_param("model", model)
-            mlflow.log_param("system_prompt", system_prompt)
-            mlflow.log_param("eval_data_size", len(eval_data))
+            tracker.log_params(run.info.run_id, {
+                "model_name": model_name,
+                "model": model,
+                "system_prompt": system_prompt,
+                "eval_data_size": len(eval_data),
+                "decoding_params": json.dumps(model_config.get("params", {}), sort_keys=True),
+                "evaluation_run": self.run_id,
+            })
+            
+            def record_prediction(position: int, prediction: Dict[str, Any]):
+                row = pending.iloc[position]
+                store.record_prediction(self.run_id, model_name, row["inputs"], row["ground_truth"], row["source_file"],
+                                        prediction["outputs"], prediction["latency"],
+                                        token_f1(prediction["outputs"], row["ground_truth"]))
             
             try:
-                # Wrap the model as an MLflow model
-                logged_model_info = mlflow.openai.log_model(
-                    model=model,
-                    task=openai.chat.completions,
-                    artifact_path="model",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": "{question}"},
-                    ],
-                    files=[
-                        {
-                            "id": "5124e1a2-9908-4b7a-8945-6fb63f2cea6e",
-                            "name": "Wiki",
-                            "type": "collection",
-                            "status": "processed"
-                        }
-                    ]
-                )
+                # Answer the questions first; stored predictions are reused, only missing rows hit the model
+                predictions = self.predict(model_config, pending["inputs"].tolist(), on_result=record_prediction)
+                cache_hits = int(predictions["from_cache"].sum())
+                print(f"🗄️  {model_name}: {cache_hits}/{len(predictions)} prediction(s) from the prediction store")
+                tracker.log_params(run.info.run_id, {"prediction_cache_hits": cache_hits})
+                
+                scored_data = pending.assign(outputs=predictions["outputs"].values, latency=predictions["latency"].values)
                 
-                # Use predefined question-answering metrics to evaluate our model
+                # The question-answering metrics of mlflow, listed explicitly: with model_type="question-answering"
+                # mlflow would also run its builtin toxicity(), which loads and runs the classifier a second time
+                from mlflow.metrics import ari_grade_level, exact_match, flesch_kincaid_grade_level, token_count
                 results = mlflow.evaluate(
-                    logged_model_info.model_uri,
-                    eval_data,
+                    data=scored_data,
+                    predictions="outputs",
                     targets="ground_truth",
-                    model_type="question-answering",
                     evaluator_config={
                         "col_mapping": {
                             "inputs": "inputs",
                             "targets": "ground_truth"
                         }
                     },
-                    extra_metrics=[mlflow.metrics.latency(), mlflow.metrics.toxicity()]
+                    extra_metrics=[
+                        exact_match(),
+                        token_count(),
+                        flesch_kincaid_grade_level(),
+                        ari_grade_level(),
+                        # Batched, cached local scorer; reports the same toxicity/v1/* metrics as mlflow.metrics.toxicity()
+                        toxicity_metric(),
+                    ]
                 )
                 
+                # Per-row scores of the metrics (toxicity/v1/score, token_count, ...) go to the store
+                eval_table = results.tables["eval_results_table"]
+                score_columns = [column for column in eval_table.columns
+                                 if column not in scored_data.columns and pd.api.types.is_numeric_dtype(eval_table[column])]
+                store.record_scores(self.run_id, model_name, pending["inputs"].tolist(),
+                                    [{column: float(value) for column, value in row.items() if pd.notna(value)}
+                                     for row in eval_table[score_columns].to_dict("records")])
+                store.merge_aggregates(self.run_id, model_name, results.metrics, rows=len(pending))
+                
+                # Aggregates, latency and confidence intervals over all scored rows of this model in the run
+                metrics = store.model_metrics(self.run_id, model_name, EVAL_CONFIDENCE, seed=EVAL_SEED)
+                
                 print(f"✅ Evaluation completed for {model_name}")
-                print(f"Aggregated metrics: {results.metrics}")
+                print(f"Aggregated metrics: {metrics}")
                 
                 # Save detailed results to CSV
-                eval_table = results.tables["eval_results_table"]
-                csv_filename = f"{model_name}_evaluation_results.csv"
-                csv_path = self.output_dir / csv_filename
-                eval_table.to_csv(csv_path, index=False)
+                csv_path = store.export_model_csv(self.run_id, model_name,
+                                                  self.output_dir / f"{model_name}_evaluation_results.csv")
                 print(f"💾 Detailed results saved to: {csv_path}")
+                store.finish_model(self.run_id, model_name)
                 
                 # Log metrics to MLflow
-                for metric_name, metric_value in results.metrics.items():
-                    if isinstance(metric_value, (int, float)):
-                        mlflow.log_metric(metric_name, metric_value)
+                tracker.log_metrics(run.info.run_id, metrics)
                 
                 return {
                     "model_name": model_name,
-                    "metrics": results.metrics,
+                    "metrics": metrics,
                     "csv_path": str(csv_path),
                     "run_id": run.info.run_id
                 }
                 
             except Exception as e:
                 print(f"❌ Error evaluating {model_name}: {str(e)}")
-                mlflow.log_param("error", str(e))
+                tracker.log_params(run.info.run_id, {"error": str(e)})
+                store.finish_model(self.run_id, model_name, error=str(e))
                 return {
                     "model_name": model_name,
                     "error": str(e),
                     "run_id": run.info.run_id
                 }
     
-    def run_all_evaluations(self) -> List[Dict[str, Any]]:
-        """Run evaluations for all configured models."""
+    def stored_result(self, model_name: str) -> Dict[str, Any]:
+        """Result of a model that the current run already evaluated completely."""
+        status = self.results_store.model_status(self.run_id, model_name)
+        csv_path = self.results_store.export_model_csv(self.run_id, model_name,
+                                                       self.output_dir / f"{model_name}_evaluation_results.csv")
+        print(f"✅ {model_name} was already evaluated in run {self.run_id}")
+        return {
+            "model_name": model_name,
+            "metrics": self.results_store.model_metrics(self.run_id, model_name, EVAL_CONFIDENCE, seed=EVAL_SEED),
+            "csv_path": str(csv_path),
+            "run_id": status.get("mlflow_run_id")
+        }
+    
+    def failed_result(self, model_config: Dict[str, Any], rows_available: int, error: str) -> Dict[str, Any]:
+        """Record and return the result of a model that could not be evaluated at all."""
+        model_name = model_config["name"]
+        print(f"❌ Error evaluating {model_name}: {error}")
+        self.results_store.start_model(self.run_id, model_name, model_config["model"], None, rows_available)
+        self.results_store.finish_model(self.run_id, model_name, error=error)
+        return {
+            "model_name": model_name,
+            "error": error,
+            "run_id": None
+        }
+    
+    def select_rows_sequentially(self, model_configs: List[Dict[str, Any]],
+                                 eval_data: pd.DataFrame) -> Tuple[Dict[str, List[int]], Dict[str, str]]:
+        """Decide per model which rows to evaluate, stopping once the ranking is settled.
+        
+        Rows are visited in a stratified order by source_file, in rounds of
+        EVAL_SEQUENTIAL_BATCH rows that all still-active models answer. After
+        each round the bootstrap interval of the token F1 against the ground
+        truth is updated, and models whose interval no longer overlaps with
+        any other model's stop. Returns the row positions used per model and
+        the errors of the models whose predictions failed.
+        """
+        order = stratified_order(eval_data["source_file"].astype(str).tolist(), seed=EVAL_SEED)
+        max_rows = min(EVAL_MAX_ROWS or len(order), len(order))
+        ranking = SequentialRanking([config["name"] for config in model_configs], min_rows=EVAL_MIN_ROWS,
+                                    max_rows=max_rows, confidence=EVAL_CONFIDENCE, precision=EVAL_CI_PRECISION,
+                                    seed=EVAL_SEED)
+        used = {config["name"]: [] for config in model_configs}
+        errors = {}
+        
+        def answer_round(model_config, rows):
+            predictions = self.predict(model_config, eval_data["inputs"].iloc[rows].tolist())
+            return [token_f1(output, target) for output, target in zip(predictions["outputs"], eval_data["ground_truth"].iloc[rows])]
+        
+        position = 0
+        while ranking.active() and position < max_rows:
+            rows = order[position:min(position + EVAL_SEQUENTIAL_BATCH, max_rows)]
+            position += len(rows)
+            active = [config for config in model_configs if config["name"] in ranking.active()]
+            
+            with ThreadPoolExecutor(max_workers=self.model_concurrency, thread_name_prefix="eval-round") as pool:
+                futures = {config["name"]: pool.submit(answer_round, config, rows) for config in active}
+            for name, future in futures.items():
+                try:
+                    ranking.add(name, future.result())
+                    used[name].extend(rows)
+                except Exception as e:
+                    # Models with rows left the error to their full evaluation, the others are reported as failed
+                    print(f"❌ {name}: {e}")
+                    errors[name] = str(e)
+                    ranking.settled[name] = True
+            
+            settled = ranking.update()
+            progress = ", ".join(
+                f"{name} {mean:.3f} [{low:.3f}, {high:.3f}]" for name in futures
+                for mean, low, high in [ranking.interval(name)]
+            )
+            print(f"  Rows {position}/{max_rows}: token F1 {progress}"
+                  + (f" - settled: {', '.join(settled)}" if settled else ""))
+        
+        return used, errors
+    
+    def run_all_evaluations(self, sequential: bool = EVAL_SEQUENTIAL) -> List[Dict[str, Any]]:
+        """Run evaluations for all configured models.
+        
+        With `sequential`, each model is only evaluated on the stratified
+        sample of rows it needed to settle its place in the ranking (see
+        select_rows_sequentially).
+        """
         print("🚀 Starting model evaluations...")
         
+        # A new evaluation run, or the one to resume; its rows in the results store are kept
+        if EVAL_RESUME:
+            self.run_id = self.results_store.latest_run() if EVAL_RESUME == "latest" else EVAL_RESUME
+            if self.run_id is None:
+                raise ValueError("EVAL_RESUME=latest, but the results store has no runs")
+            print(f"♻️  Resuming evaluation run {self.run_id} from {EVAL_RESULTS_PATH}")
+        else:
+            self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+            print(f"🆔 Evaluation run {self.run_id}, results stored in {EVAL_RESULTS_PATH}")
+        
+        # Import mlflow before the worker threads need it
+        load_mlflow()
+        
         # Load evaluation data
         eval_data = self.load_eval_data()
         
         # Get model configurations
         model_configs = self.get_model_configurations()
         
-        print(f"📊 Will evaluate {len(model_configs)} models on {len(eval_data)} questions")
+        print(f"📊 Will evaluate {len(model_configs)} models on {len(eval_data)} questions "
+              f"({self.model_concurrency} model(s) at a time, {self.row_concurrency} concurrent question(s) per model)")
+        
+        rows_used = None
+        selection_errors = {}
         
-        # Run evaluations
-        results = []
-        for i, model_config in enumerate(model_configs, 1):
+        def run_one(numbered_config):
+            i, model_config = numbered_config
             print(f"\n{'='*50}")
             print(f"Model {i}/{len(model_configs)}: {model_config['name']}")
             print(f"{'='*50}")
+            if rows_used is None:
+                result = self.evaluate_model(model_config, eval_data)
+            elif not rows_used[model_config["name"]]:
+                # Its predictions failed before any row was used, so there is nothing to score
+                result = self.failed_result(model_config, len(eval_data),
+                                            selection_errors.get(model_config["name"], "No rows were selected for evaluation"))
+            else:
+                sample = eval_data.iloc[sorted(rows_used[model_config["name"]])].reset_index(drop=True)
+                result = self.evaluate_model(model_config, sample, rows_available=len(eval_data))
+            # Keep the summary current, so a crash in a later model doesn't lose it
+            self.create_summary_report(verbose=False)
+            return result
+        
+        # Run evaluations; every model gets its own MLflow run in its own thread
+        started = time.monotonic()
+        self.prediction_cache = self.open_prediction_cache()
+        try:
+            if sequential:
+                print(f"🎯 Sequential evaluation: rounds of {EVAL_SEQUENTIAL_BATCH} stratified rows, "
+                      f"at least {EVAL_MIN_ROWS}, {EVAL_CONFIDENCE:.0%} bootstrap intervals")
+                rows_used, selection_errors = self.select_rows_sequentially(model_configs, eval_data)
+                for name, rows in rows_used.items():
+                    print(f"  {name}: {len(rows)}/{len(eval_data)} rows used")
             
-            result = self.evaluate_model(model_config, eval_data)
-            results.append(result)
+            with ThreadPoolExecutor(max_workers=self.model_concurrency, thread_name_prefix="eval-model") as pool:
+                results = list(pool.map(run_one, enumerate(model_configs, 1)))
+        finally:
+            if self.prediction_cache is not None:
+                stats = self.prediction_cache.stats()
+                print(f"\n🗄️  Prediction store: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['entries']} entries stored")
+                self.prediction_cache.close()
+                self.prediction_cache = None
+            scorer = get_scorer()
+            print(f"☣️  Toxicity scorer: {scorer.scored} output(s) scored, {scorer.cache_hits} from cache")
+            # Deliver the queued params and metrics before the report; whatever the server didn't take is retried at exit
+            tracker = get_tracking_writer()
+            if not tracker.flush(timeout=TRACKING_SHUTDOWN_TIMEOUT):
+                print("⚠️  Not all params and metrics reached the MLflow tracking server yet")
+            print("📡 MLflow tracking:")
+            tracker.print_stats()
+        print(f"\n⏱️  Evaluated {len(model_configs)} models in {time.monotonic() - started:.1f}s, peak memory {peak_memory()}")
+        
+        print("\n🚦 Request scheduler:")
+        get_scheduler().print_metrics()
         
         # Create summary report
-        self.create_summary_report(results)
+        self.create_summary_report()
         
         return results
     
-    def create_summary_report(self, results: List[Dict[str, Any]]):
-        """Create a summary report of all evaluations."""
-        print("\n📋 Creating summary report...")
-        
-        summary_data = []
-        for result in results:
-            if "error" not in result:
-                row = {"model_name": result["model_name"]}
-                row.update(result["metrics"])
-                row["csv_path"] = result["csv_path"]
-                row["run_id"] = result["run_id"]
-                summary_data.append(row)
-            else:
-                summary_data.append({
-                    "model_name": result["model_name"],
-                    "error": result["error"],
-                    "run_id": result["run_id"]
-                })
-        
-        # Save summary to CSV
-        summary_df = pd.DataFrame(summary_data)
-        summary_path = self.output_dir / "evaluation_summary.csv"
-        summary_df.to_csv(summary_path, index=False)
-        
-        print(f"📄 Summary report saved to: {summary_path}")
-        print("\n🎯 Evaluation Summary:")
-        print(summary_df.to_string(index=False))
+    def create_summary_report(self, verbose: bool = True):
+        """Create a summary report of the current run from the results store.
+        
+        The summary and the per-model CSVs are queries over the store, so
+        they can also be regenerated later with `python results_store.py`.
+        """
+        if verbose:
+            print("\n📋 Creating summary report...")
+        
+        # Models finishing at the same time would otherwise write the same files
+        with self._summary_lock:
+            summary_df = self.results_store.summary(self.run_id, self.output_dir, EVAL_CONFIDENCE, seed=EVAL_SEED)
+            
+            # Save summary to CSV
+            summary_path = self.output_dir / "evaluation_summary.csv"
+            summary_df.to_csv(summary_path, index=False)
+        
+        if verbose:
+            print(f"📄 Summary report saved to: {summary_path}")
+            print("\n🎯 Evaluation Summary:")
+            print(summary_df.to_string(index=False))
         
         return summary_path
 
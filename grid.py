@@ -0,0 +1,107 @@
+"""
+Concurrency limits and progress reporting for the eval-langfuse.py experiment grid.
+
+eval-langfuse.py runs the experiments of its model x temperature x prompt grid
+and their dataset items as asyncio tasks instead of one after the other. What
+actually bounds the sweep is the capacity of the backends, so the requests are
+capped where they are sent:
+
+- `ConcurrencyLimits.slot(endpoint, model)` admits at most
+  EVAL_LANGFUSE_MODEL_CONCURRENCY requests per model (with per-model overrides
+  in EVAL_LANGFUSE_MODEL_LIMITS) and EVAL_LANGFUSE_ENDPOINT_CONCURRENCY per
+  endpoint; requests over a limit wait for a free slot. The request scheduler
+  still enforces the rate limits on top of that.
+- `Progress` counts finished items and prints the rate and the estimated time
+  left every few seconds.
+
+Configured with environment variables:
+
+- EVAL_LANGFUSE_MODEL_CONCURRENCY: requests in flight per model (default 4)
+- EVAL_LANGFUSE_MODEL_LIMITS: JSON object with per-model overrides, e.g. {"llama3.3:70b": 1}
+- EVAL_LANGFUSE_ENDPOINT_CONCURRENCY: requests in flight per endpoint (default 8)
+- EVAL_LANGFUSE_PROGRESS_INTERVAL: seconds between progress lines (default 10)
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ConcurrencyLimits:
+    """Caps the requests in flight per model and per endpoint."""
+
+    def __init__(self, model_limit: int = 4, endpoint_limit: int = 8, model_limits: Optional[Dict[str, int]] = None):
+        self.model_limit = model_limit
+        self.endpoint_limit = endpoint_limit
+        self.model_limits = dict(model_limits or {})
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._endpoints: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_env(cls) -> "ConcurrencyLimits":
+        return cls(
+            model_limit=int(os.getenv("EVAL_LANGFUSE_MODEL_CONCURRENCY", "4")),
+            endpoint_limit=int(os.getenv("EVAL_LANGFUSE_ENDPOINT_CONCURRENCY", "8")),
+            model_limits={model: int(limit)
+                          for model, limit in json.loads(os.getenv("EVAL_LANGFUSE_MODEL_LIMITS") or "{}").items()},
+        )
+
+    def _model(self, model: str) -> asyncio.Semaphore:
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self.model_limits.get(model, self.model_limit))
+        return self._models[model]
+
+    def _endpoint(self, endpoint: str) -> asyncio.Semaphore:
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = asyncio.Semaphore(self.endpoint_limit)
+        return self._endpoints[endpoint]
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str, model: str) -> AsyncIterator[None]:
+        """Hold a request slot of the model and of the endpoint; the model slot is taken first."""
+        async with self._model(model):
+            async with self._endpoint(endpoint):
+                yield
+
+
+class Progress:
+    """Finished/total counter that prints the rate and an ETA at most every `interval` seconds."""
+
+    def __init__(self, label: str, total: int, interval: float = 10.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = time.monotonic()
+        self._printed = self.started
+
+    @classmethod
+    def from_env(cls, label: str, total: int) -> "Progress":
+        return cls(label, total, interval=float(os.getenv("EVAL_LANGFUSE_PROGRESS_INTERVAL", "10")))
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = format_duration((self.total - self.done) / rate) if rate > 0 else "?"
+        percent = self.done / self.total if self.total else 1.0
+        return (f"{self.label}: {self.done}/{self.total} ({percent:.0%}), {rate:.2f}/s, "
+                f"elapsed {format_duration(elapsed)}, ETA {eta}")
+
+    def advance(self, count: int = 1):
+        self.done += count
+        now = time.monotonic()
+        if self.done >= self.total or now - self._printed >= self.interval:
+            self._printed = now
+            print(f"⏳ {self.line()}")
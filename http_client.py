@@ -0,0 +1,102 @@
+"""
+Shared asynchronous HTTP client with connection pooling.
+
+eval-langfuse.py sends its generation and judge requests through one
+`AsyncHTTPClient` per event loop instead of a `requests.post` per call, so
+connections to the OpenWebUI/Ollama host are kept alive and reused, and many
+requests can be in flight without a thread each:
+
+- keep-alive connection pool shared by all requests (httpx),
+- at most HTTP_MAX_CONNECTIONS_PER_HOST requests in flight per host; the others
+  wait for a free connection instead of opening new ones,
+- HTTP/2 when the `h2` package is installed (`pip install h2`) and HTTP2 is
+  not set to 0; otherwise HTTP/1.1,
+- separate connect and read timeouts.
+
+Configured with environment variables:
+
+- HTTP_MAX_CONNECTIONS_PER_HOST: concurrent requests per host (default 16)
+- HTTP_MAX_KEEPALIVE_CONNECTIONS: idle connections kept open (default 32)
+- HTTP_KEEPALIVE_EXPIRY: seconds an idle connection stays open (default 30)
+- HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT: seconds (defaults 10 / 120)
+- HTTP2: set to 0 to always use HTTP/1.1
+"""
+
+import asyncio
+import importlib.util
+import os
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def http2_available() -> bool:
+    """Whether httpx can speak HTTP/2, which needs the optional h2 package."""
+    return importlib.util.find_spec("h2") is not None
+
+
+class AsyncHTTPClient:
+    """Pooled httpx.AsyncClient with a cap on the requests in flight per host."""
+
+    def __init__(self, max_connections_per_host: int = 16, max_keepalive_connections: int = 32,
+                 keepalive_expiry: float = 30.0, connect_timeout: float = 10.0, read_timeout: float = 120.0,
+                 http2: bool = True):
+        self.max_connections_per_host = max_connections_per_host
+        self.http2 = http2 and http2_available()
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=max_keepalive_connections,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_env(cls) -> "AsyncHTTPClient":
+        return cls(
+            max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "16")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "32")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "120")),
+            http2=os.getenv("HTTP2", "1") != "0",
+        )
+
+    def _host_slots(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._hosts[host]
+
+    async def post(self, url: str, content: bytes, headers: Optional[Dict[str, str]] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+        """POST a pre-serialized body; raises httpx.HTTPStatusError for error responses."""
+        async with self._host_slots(url):
+            response = await self.client.post(url, content=content, headers=headers,
+                                              timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        response.raise_for_status()
+        return response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# httpx clients and semaphores belong to the event loop they were created in
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHTTPClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> AsyncHTTPClient:
+    """The client of the running event loop, configured from the environment."""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = AsyncHTTPClient.from_env()
+    return _clients[loop]
+
+
+async def close_http_client():
+    """Close the connections of the running event loop's client."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,111 @@
+"""
+Memory-efficient loading of the generated dataset for evaluation.
+
+The dataset (a CSV file, or a directory of JSONL/Parquet shards written by
+main.py) is read with pyarrow in record batches: CSV through the streaming CSV
+reader, Parquet shards memory-mapped. Columns are converted to Arrow-backed
+pandas strings (`string[pyarrow]`), so every answer is stored once in a compact
+Arrow buffer instead of as a Python object per cell, and the columns are
+renamed to the evaluation layout without copying them.
+
+`iter_eval_batches` yields the batches one at a time; `load_eval_frame`
+concatenates them when the whole dataset is needed at once (mlflow.evaluate).
+`peak_memory` reports the peak resident set size and Arrow allocations.
+"""
+
+import resource
+import sys
+from pathlib import Path
+from typing import Dict, Iterator
+
+from writer import FIELDNAMES, list_shards
+
+# Dataset column -> evaluation column
+EVAL_COLUMNS = {"question": "inputs", "answer": "ground_truth", "source_file": "source_file"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.json
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Streaming the evaluation dataset requires pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def iter_record_batches(path: str, batch_size: int = 10000) -> Iterator:
+    """Stream the dataset as pyarrow RecordBatches with the question/answer/source_file columns."""
+    pa = _pyarrow()
+    path = Path(path)
+    string_columns = {name: pa.string() for name in FIELDNAMES}
+
+    if not path.is_dir():
+        reader = pa.csv.open_csv(
+            path,
+            # Roughly batch_size rows of a few hundred bytes per block
+            read_options=pa.csv.ReadOptions(block_size=max(1 << 20, batch_size * 512)),
+            convert_options=pa.csv.ConvertOptions(column_types=string_columns, include_columns=FIELDNAMES),
+        )
+        for batch in reader:
+            yield batch
+        return
+
+    parquet_shards = list_shards(path, "parquet")
+    if parquet_shards:
+        for shard in parquet_shards:
+            parquet_file = pa.parquet.ParquetFile(shard, memory_map=True)
+            yield from parquet_file.iter_batches(batch_size=batch_size, columns=FIELDNAMES)
+        return
+
+    jsonl_shards = list_shards(path, "jsonl")
+    if jsonl_shards:
+        schema = pa.schema([(name, pa.string()) for name in FIELDNAMES])
+        for shard in jsonl_shards:
+            table = pa.json.read_json(shard, parse_options=pa.json.ParseOptions(explicit_schema=schema))
+            yield from table.select(FIELDNAMES).to_batches(max_chunksize=batch_size)
+        return
+
+    raise FileNotFoundError(f"No part-*.parquet or part-*.jsonl shards found in {path}")
+
+
+def _to_eval_frame(table):
+    import pandas as pd
+
+    pa = _pyarrow()
+    frame = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow"),
+                                          pa.large_string(): pd.StringDtype("pyarrow")}.get)
+    return frame.rename(columns=EVAL_COLUMNS)[list(EVAL_COLUMNS.values())]
+
+
+def iter_eval_batches(path: str, batch_size: int = 10000) -> Iterator:
+    """Stream the dataset as DataFrames in the evaluation layout (inputs, ground_truth, source_file)."""
+    pa = _pyarrow()
+    for batch in iter_record_batches(path, batch_size):
+        yield _to_eval_frame(pa.Table.from_batches([batch]))
+
+
+def load_eval_frame(path: str, batch_size: int = 10000):
+    """Load the whole dataset into one Arrow-backed DataFrame in the evaluation layout."""
+    pa = _pyarrow()
+    batches = list(iter_record_batches(path, batch_size))
+    if batches:
+        table = pa.Table.from_batches(batches)
+    else:
+        table = pa.table({name: pa.array([], type=pa.string()) for name in FIELDNAMES})
+    # string[pyarrow] columns keep referencing the batch buffers, nothing is copied
+    return _to_eval_frame(table)
+
+
+def peak_memory() -> Dict[str, float]:
+    """Peak resident set size of the process and peak/current Arrow allocations, in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    peak_rss = maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+    report = {"peak_rss_mb": round(peak_rss, 1)}
+    if "pyarrow" in sys.modules:
+        pool = sys.modules["pyarrow"].default_memory_pool()
+        report["arrow_peak_mb"] = round(pool.max_memory() / (1024 * 1024), 1)
+        report["arrow_allocated_mb"] = round(pool.bytes_allocated() / (1024 * 1024), 1)
+    return report
@@ -1,16 +1,82 @@
 import os
-import csv
+import asyncio
+import argparse
+import itertools
+import json
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import List, NamedTuple, Optional
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.schema import HumanMessage
+from cache import DiskCache, hash_key
+from manifest import RunManifest
+from writer import DatasetWriter, iter_dataset_rows
+from dedup import DedupIndex
+from discovery import iter_documents, read_document, is_blank, MMAP_THRESHOLD
+from chunking import chunk_markdown, allocate_questions, count_tokens
+from scheduler import get_scheduler
+import batch
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Corpus discovery: root directory and comma-separated include/exclude glob patterns
+FILES_DIR = os.getenv('FILES_DIR', 'files')
+FILES_INCLUDE = [p.strip() for p in os.getenv('FILES_INCLUDE', '*.md').split(',') if p.strip()]
+FILES_EXCLUDE = [p.strip() for p in os.getenv('FILES_EXCLUDE', '').split(',') if p.strip()]
+# Files larger than this are read through a memory map
+MMAP_THRESHOLD_MB = float(os.getenv('MMAP_THRESHOLD_MB', str(MMAP_THRESHOLD // (1024 * 1024))))
+
+# Maximum number of files being generated at the same time
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '8'))
+# Seconds to wait for a single generation request before giving up on it
+GENERATION_TIMEOUT = float(os.getenv('GENERATION_TIMEOUT', '300'))
+
+# Content-addressed cache of generated Q&A sets, so unchanged files are not regenerated
+GENERATION_CACHE_ENABLED = os.getenv('GENERATION_CACHE', '1') != '0'
+GENERATION_CACHE_PATH = os.getenv('GENERATION_CACHE_PATH', './output/cache/generation.sqlite')
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', '100000'))
+GENERATION_CACHE_MAX_MB = float(os.getenv('GENERATION_CACHE_MAX_MB', '512'))
+
+# Files larger than this many tokens are split into chunks that are generated in parallel
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '8000'))
+
+# Small-file packing: files of at most PACK_FILE_MAX_TOKENS are combined into one request
+# of up to PACK_MAX_TOKENS content tokens and PACK_MAX_FILES files
+PACK_SMALL_FILES = os.getenv('PACK_SMALL_FILES', '0') == '1'
+PACK_FILE_MAX_TOKENS = int(os.getenv('PACK_FILE_MAX_TOKENS', '1000'))
+PACK_MAX_TOKENS = int(os.getenv('PACK_MAX_TOKENS', '6000'))
+PACK_MAX_FILES = int(os.getenv('PACK_MAX_FILES', '5'))
+
+# Number of question-answer pairs generated per source file
+QUESTIONS_PER_FILE = 10
+# Completion tokens budgeted per generated question-answer pair when reserving rate-limit capacity
+ANSWER_TOKENS_ESTIMATE = 150
+
+# Offline batch mode: "openai" for an OpenAI-compatible batch API, "local" for the file-based stand-in
+BATCH_BACKEND = os.getenv('BATCH_BACKEND', 'openai')
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '30'))
+BATCH_DIR = "./output/batches"
+
+# Output stage: "csv" (single file), or "jsonl" / "parquet" shards in a directory
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'csv')
+OUTPUT_ROWS_PER_SHARD = int(os.getenv('OUTPUT_ROWS_PER_SHARD', '100000'))
+# Output is fsynced (and finished files recorded in the manifest) every N rows or T seconds
+OUTPUT_FSYNC_ROWS = int(os.getenv('OUTPUT_FSYNC_ROWS', '1000'))
+OUTPUT_FSYNC_INTERVAL = float(os.getenv('OUTPUT_FSYNC_INTERVAL', '5'))
+
+# Near-duplicate question removal across the whole dataset (MinHash/LSH)
+DEDUP_ENABLED = os.getenv('DEDUP', '1') != '0'
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.85'))
+DEDUP_NUM_PERM = int(os.getenv('DEDUP_NUM_PERM', '128'))
+DEDUP_REPORT_PATH = "./output/dedup_report.json"
+
 class QuestionAnswer(BaseModel):
     """A single question-answer pair."""
     question: str = Field(description="A question based on the content")
@@ -24,20 +90,50 @@ class QuestionAnswerSet(BaseModel):
         max_length=10
     )
 
+@lru_cache(maxsize=None)
+def question_answer_set_model(num_questions):
+    """Return a QuestionAnswerSet schema that requires exactly num_questions pairs."""
+    if num_questions == QUESTIONS_PER_FILE:
+        return QuestionAnswerSet
+    return create_model(
+        "QuestionAnswerSet",
+        __doc__=f"A set of {num_questions} question-answer pairs.",
+        qa_pairs=(List[QuestionAnswer], Field(
+            description=f"Exactly {num_questions} question-answer pairs based on the content",
+            min_length=num_questions,
+            max_length=num_questions
+        ))
+    )
+
+@lru_cache(maxsize=None)
+def packed_question_answer_sets_model(num_documents, num_questions=QUESTIONS_PER_FILE):
+    """Return a schema with one set of num_questions pairs for each of num_documents packed documents."""
+    document_set = create_model(
+        "DocumentQuestionAnswerSet",
+        __doc__=f"The {num_questions} question-answer pairs generated for one document.",
+        document_id=(int, Field(description="The id of the document these questions are about")),
+        qa_pairs=(List[QuestionAnswer], Field(
+            description=f"Exactly {num_questions} question-answer pairs based on this document only",
+            min_length=num_questions,
+            max_length=num_questions
+        ))
+    )
+    return create_model(
+        "PackedQuestionAnswerSets",
+        __doc__=f"Question-answer pairs for {num_documents} documents.",
+        documents=(List[document_set], Field(
+            description=f"Exactly one entry for each of the {num_documents} documents",
+            min_length=num_documents,
+            max_length=num_documents
+        ))
+    )
+
 def read_markdown_file(file_path):
     """Read content from a markdown file."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+    return read_document(file_path, mmap_threshold=int(MMAP_THRESHOLD_MB * 1024 * 1024))
 
-def generate_questions_and_answers(content, llm):
-    """Generate 10 questions and answers based on the given content using structured output."""
-    # Create a structured output LLM
-    structured_llm = llm.with_structured_output(QuestionAnswerSet)
-    
-    prompt_template = PromptTemplate(
-        input_variables=["content"],
-        template="""
-Based on the following content, generate exactly 10 diverse questions and their corresponding answers.
+PROMPT_TEMPLATE = """
+Based on the following content, generate exactly {num_questions} diverse questions and their corresponding answers.
 The questions should cover different aspects of the content including:
 - Key concepts and definitions
 - Examples and applications
@@ -50,31 +146,585 @@ Make sure each answer is comprehensive and accurate based on the provided conten
 Content:
 {content}
 """
+
+PACKED_PROMPT_TEMPLATE = """
+Below are {num_documents} separate documents, each wrapped in <document id="..."> tags.
+For EACH document, generate exactly {num_questions} diverse questions and their corresponding answers based only on that document.
+The questions should cover different aspects of the content including:
+- Key concepts and definitions
+- Examples and applications
+- Comparisons and contrasts
+- Benefits and limitations
+- How-to or procedural questions
+
+Make sure each answer is comprehensive and accurate based on the provided content. Each question and answer should be in flemish.
+Return one entry per document, with the id of the document it belongs to.
+
+Documents:
+{documents}
+"""
+
+def build_prompt(content, num_questions=QUESTIONS_PER_FILE):
+    """Build the question generation prompt for the given content."""
+    prompt_template = PromptTemplate(
+        input_variables=["content", "num_questions"],
+        template=PROMPT_TEMPLATE
+    )
+    
+    return prompt_template.format(content=content, num_questions=num_questions)
+
+def build_packed_prompt(contents, num_questions=QUESTIONS_PER_FILE):
+    """Build one prompt asking for num_questions pairs for each of several documents."""
+    prompt_template = PromptTemplate(
+        input_variables=["documents", "num_documents", "num_questions"],
+        template=PACKED_PROMPT_TEMPLATE
     )
+    documents = "\n\n".join(
+        f'<document id="{i}">\n{content}\n</document>' for i, content in enumerate(contents)
+    )
+    
+    return prompt_template.format(documents=documents, num_documents=len(contents), num_questions=num_questions)
+
+def generate_questions_and_answers(content, llm, num_questions=QUESTIONS_PER_FILE):
+    """Generate questions and answers based on the given content using structured output."""
+    # Create a structured output LLM
+    structured_llm = llm.with_structured_output(question_answer_set_model(num_questions))
     
-    prompt = prompt_template.format(content=content)
+    prompt = build_prompt(content, num_questions)
     response = structured_llm.invoke([HumanMessage(content=prompt)])
     
     return response.qa_pairs
 
-def write_header_to_csv(output_file):
-    """Write CSV header."""
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['source_file', 'question', 'answer']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-def append_to_csv(qa_data, output_file):
-    """Append Q&A data to CSV file and flush immediately."""
-    with open(output_file, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['source_file', 'question', 'answer']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+async def agenerate_questions_and_answers(content, llm, num_questions=QUESTIONS_PER_FILE):
+    """Async variant of generate_questions_and_answers using ainvoke."""
+    structured_llm = llm.with_structured_output(question_answer_set_model(num_questions))
+    
+    prompt = build_prompt(content, num_questions)
+    response = await structured_llm.ainvoke([HumanMessage(content=prompt)])
+    
+    return response.qa_pairs
+
+async def agenerate_packed_questions_and_answers(contents, llm, num_questions=QUESTIONS_PER_FILE):
+    """Generate num_questions pairs for each of several small documents in a single request.
+    
+    Returns a list with the Q&A pairs of each document, in the order of
+    `contents`. Documents the model did not answer for are None.
+    """
+    structured_llm = llm.with_structured_output(packed_question_answer_sets_model(len(contents), num_questions))
+    
+    prompt = build_packed_prompt(contents, num_questions)
+    response = await structured_llm.ainvoke([HumanMessage(content=prompt)])
+    
+    qa_sets = [None] * len(contents)
+    for document in response.documents:
+        if 0 <= document.document_id < len(contents) and qa_sets[document.document_id] is None:
+            qa_sets[document.document_id] = document.qa_pairs
+    return qa_sets
+
+def estimate_request_tokens(content, num_questions=QUESTIONS_PER_FILE, template=PROMPT_TEMPLATE, content_tokens=None):
+    """Rough prompt + completion token count of one generation request, for the TPM budget."""
+    if content_tokens is None:
+        content_tokens = count_tokens(content)
+    return content_tokens + count_tokens(template) + num_questions * ANSWER_TOKENS_ESTIMATE
+
+def generation_cache_key(content, model_name, temperature, num_questions=QUESTIONS_PER_FILE, template=PROMPT_TEMPLATE):
+    """Cache key covering everything that influences the generated Q&A set."""
+    return hash_key(content, template, model_name, temperature, num_questions)
+
+def open_generation_cache():
+    """Open the persistent generation cache, or return None when it is disabled."""
+    if not GENERATION_CACHE_ENABLED:
+        return None
+    return DiskCache(
+        GENERATION_CACHE_PATH,
+        max_entries=GENERATION_CACHE_MAX_ENTRIES,
+        max_bytes=int(GENERATION_CACHE_MAX_MB * 1024 * 1024)
+    )
+
+def open_dataset_writer(output_path, manifest, resume=False):
+    """Start the single writer stage that owns the output and feeds the run manifest.
+    
+    Rows are written with a tag of (source_file, status, error); once they are
+    on disk the writer calls back and the files are recorded in the manifest
+    with one fsync per batch.
+    """
+    def record_durable(items):
+        for (source_file, status, rows, error), position in items:
+            manifest.record(source_file, status, rows=rows, error=error,
+                            position=position if rows else None, sync=False)
+        manifest.sync()
+    
+    return DatasetWriter(
+        output_path,
+        OUTPUT_FORMAT,
+        rows_per_shard=OUTPUT_ROWS_PER_SHARD,
+        fsync_rows=OUTPUT_FSYNC_ROWS,
+        fsync_interval=OUTPUT_FSYNC_INTERVAL,
+        on_durable=record_durable,
+        append=resume,
+        resume_position=manifest.position() if resume else None
+    )
+
+def open_dedup_index(output_path, resume=False):
+    """Create the near-duplicate index, seeded with the rows already in the output when resuming."""
+    if not DEDUP_ENABLED:
+        return None
+    
+    dedup = DedupIndex(threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM)
+    if resume:
+        for row in iter_dataset_rows(output_path, OUTPUT_FORMAT):
+            dedup.add(row)
+        print(f"Indexed {dedup.rows_seen} existing question(s) for near-duplicate detection")
+    return dedup
+
+def output_path_for(output_format):
+    """CSV output file, or the shard directory of the jsonl/parquet output.
+    
+    Every format has its own output, and so its own manifest: a manifest
+    position always refers to the files of the format that wrote it.
+    """
+    if output_format == "csv":
+        return "./output/generated_questions_and_answers.csv"
+    return f"./output/generated_questions_and_answers_{output_format}"
+
+def manifest_path_for(output_path):
+    """Location of the run manifest belonging to an output dataset, e.g. `<name>_jsonl.manifest.jsonl`."""
+    return str(Path(output_path).with_suffix('.manifest.jsonl'))
+
+class GenerationTimeout(asyncio.TimeoutError):
+    """A generation request, retries included, did not finish within its time budget."""
+    
+    def __init__(self, elapsed, attempts):
+        super().__init__(f"Timed out after {elapsed:.0f}s ({attempts} attempt(s))")
+        self.elapsed = elapsed
+        self.attempts = attempts
+
+async def run_generation(request, llm, tokens, timeout):
+    """Run a generation request through the scheduler within an overall budget of `timeout` seconds.
+    
+    The budget covers throttling, every retry and the backoff between them, so
+    a file never holds its request slot for longer than `timeout`. Raises
+    GenerationTimeout with the elapsed time and the number of attempts made.
+    """
+    attempts = 0
+    
+    def attempt():
+        nonlocal attempts
+        attempts += 1
+        return request()
+    
+    started = time.monotonic()
+    try:
+        return await asyncio.wait_for(
+            get_scheduler().arun(attempt, endpoint=llm.openai_api_base or "", model=llm.model_name, tokens=tokens),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        raise GenerationTimeout(time.monotonic() - started, attempts) from None
+
+async def generate_chunk(chunk, num_questions, llm, request_semaphore, timeout, cache=None, chunk_tokens=None):
+    """Generate Q&A pairs for one chunk of a file (of chunk_tokens tokens, if known).
+    
+    Returns a (qa_pairs, from_cache) tuple. Cache hits are replayed without a
+    network call; only actual requests count against the request semaphore.
+    """
+    cache_key = generation_cache_key(chunk, llm.model_name, llm.temperature, num_questions)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        return question_answer_set_model(num_questions).model_validate(cached).qa_pairs, True
+    
+    # The scheduler enforces the endpoint's rate limits and retries throttled or failed requests
+    async with request_semaphore:
+        qa_pairs = await run_generation(
+            lambda: agenerate_questions_and_answers(chunk, llm, num_questions),
+            llm,
+            estimate_request_tokens(chunk, num_questions, content_tokens=chunk_tokens),
+            timeout
+        )
+    
+    if cache is not None:
+        cache.set(cache_key, {"qa_pairs": [qa.model_dump() for qa in qa_pairs]})
+    return qa_pairs, False
+
+async def process_file(md_file, llm, file_semaphore, request_semaphore, timeout, cache=None, max_tokens=CHUNK_MAX_TOKENS,
+                       content=None, tokens=None):
+    """Generate the CSV rows for a single markdown file.
+    
+    Large files are split into token-budgeted chunks which are generated in
+    parallel, with the file's questions allocated to chunks by size. The
+    content and token count of a file that was already read (see
+    iter_work_units) can be passed in, so it isn't read or tokenized again.
+    
+    Returns a (status, rows, log_lines, error) tuple where status is "done",
+    "skipped" or "failed". Output is buffered in log_lines so that files
+    processed concurrently don't interleave their progress messages.
+    """
+    log = []
+    async with file_semaphore:
+        try:
+            if content is None:
+                content = read_markdown_file(md_file)
+            
+            if is_blank(content):
+                log.append(f"  Warning: {md_file} is empty, skipping...")
+                return "skipped", [], log, None
+            
+            log.append(f"  Content length: {len(content)} characters")
+            
+            if tokens is None:
+                tokens = count_tokens(content)
+            chunks = chunk_markdown(content, max_tokens, tokens=tokens)
+            sizes = [tokens] if len(chunks) == 1 else [count_tokens(chunk) for chunk in chunks]
+            allocation = allocate_questions(sizes, QUESTIONS_PER_FILE)
+            work = [(chunk, n, size) for chunk, n, size in zip(chunks, allocation, sizes) if n > 0]
+            if len(chunks) > 1:
+                log.append(f"  Split into {len(chunks)} chunks, generating from {len(work)} of them")
+            
+            # Generate Q&A pairs for all chunks in parallel using structured output
+            results = await asyncio.gather(*(
+                generate_chunk(chunk, n, llm, request_semaphore, timeout, cache, chunk_tokens=size)
+                for chunk, n, size in work
+            ))
+            qa_pairs = [qa for chunk_pairs, _ in results for qa in chunk_pairs]
+            cache_hits = sum(1 for _, from_cache in results if from_cache)
+            
+            if cache_hits == len(results):
+                log.append(f"  Cache hit, replayed {len(qa_pairs)} Q&A pairs")
+            else:
+                log.append(f"  Generated {len(qa_pairs)} Q&A pairs ({cache_hits}/{len(results)} chunk(s) from cache)")
+            
+            return "done", qa_rows(md_file, qa_pairs), log, None
+        
+        except GenerationTimeout as e:
+            error = str(e)
+            log.append(f"  ❌ {error} processing {md_file}")
+            return "failed", [], log, error
+        except Exception as e:
+            log.append(f"  ❌ Error processing {md_file}: {str(e)}")
+            return "failed", [], log, str(e)
+
+def qa_rows(source_file, qa_pairs):
+    """Convert Q&A pairs into output rows attributed to source_file."""
+    return [{
+        'source_file': str(source_file),
+        'question': qa.question,
+        'answer': qa.answer
+    } for qa in qa_pairs]
+
+async def process_pack(pack, llm, file_semaphore, request_semaphore, timeout, cache=None):
+    """Generate the rows for a pack of small files with a single request.
+    
+    `pack` is a list of ReadFile tuples. Files that are cached are
+    replayed, the rest share one structured-output request whose answer is
+    attributed back to each file by document id. Files the packed response
+    misses (or all of them, if the packed request fails) are generated with a
+    request of their own.
+    
+    Returns a list of (md_file, status, rows, log_lines, error) tuples in pack order.
+    """
+    results = {}
+    async with file_semaphore:
+        pending = []
+        for md_file, content, tokens in pack:
+            # Keyed like a single-chunk file of its own, so runs with and without packing share their results
+            cache_key = generation_cache_key(content, llm.model_name, llm.temperature, QUESTIONS_PER_FILE)
+            cached = cache.get(cache_key) if cache is not None else None
+            if cached is not None:
+                qa_pairs = question_answer_set_model(QUESTIONS_PER_FILE).model_validate(cached).qa_pairs
+                results[md_file] = ("done", qa_rows(md_file, qa_pairs), [f"  Cache hit, replayed {len(qa_pairs)} Q&A pairs"], None)
+            else:
+                pending.append((md_file, content, tokens, cache_key))
         
-        for row in qa_data:
-            writer.writerow(row)
-        csvfile.flush()  # Ensure data is written to disk immediately
+        qa_sets = [None] * len(pending)
+        pack_error = None
+        if len(pending) > 1:
+            contents = [content for _, content, _, _ in pending]
+            try:
+                async with request_semaphore:
+                    qa_sets = await run_generation(
+                        lambda: agenerate_packed_questions_and_answers(contents, llm),
+                        llm,
+                        estimate_request_tokens("", QUESTIONS_PER_FILE * len(contents), PACKED_PROMPT_TEMPLATE,
+                                                content_tokens=sum(tokens for _, _, tokens, _ in pending)),
+                        timeout
+                    )
+            except Exception as e:
+                pack_error = str(e)
+        
+        for (md_file, content, tokens, cache_key), qa_pairs in zip(pending, qa_sets):
+            if qa_pairs is not None:
+                if cache is not None:
+                    cache.set(cache_key, {"qa_pairs": [qa.model_dump() for qa in qa_pairs]})
+                results[md_file] = ("done", qa_rows(md_file, qa_pairs),
+                                    [f"  Generated {len(qa_pairs)} Q&A pairs in a packed request for {len(pending)} file(s)"], None)
+                continue
+            
+            log = []
+            if pack_error is not None:
+                log.append(f"  Packed request failed ({pack_error}), generating this file on its own")
+            elif len(pending) > 1:
+                log.append("  Missing from the packed response, generating this file on its own")
+            try:
+                qa_pairs, from_cache = await generate_chunk(content, QUESTIONS_PER_FILE, llm, request_semaphore, timeout, cache,
+                                                            chunk_tokens=tokens)
+                log.append(f"  {'Cache hit, replayed' if from_cache else 'Generated'} {len(qa_pairs)} Q&A pairs")
+                results[md_file] = ("done", qa_rows(md_file, qa_pairs), log, None)
+            except GenerationTimeout as e:
+                error = str(e)
+                log.append(f"  ❌ {error} processing {md_file}")
+                results[md_file] = ("failed", [], log, error)
+            except Exception as e:
+                log.append(f"  ❌ Error processing {md_file}: {str(e)}")
+                results[md_file] = ("failed", [], log, str(e))
+    
+    return [(md_file, *results[md_file]) for md_file, _, _ in pack]
+
+class ReadFile(NamedTuple):
+    """A source file that was already read, with its token count."""
+    path: Path
+    content: str
+    tokens: Optional[int]
 
-def main():
+def iter_work_units(md_files, file_max_tokens=PACK_FILE_MAX_TOKENS, max_tokens=PACK_MAX_TOKENS, max_files=PACK_MAX_FILES):
+    """Group small files into packs for process_pack.
+    
+    Yields a path (a large file, generated on its own and not read here), a
+    ReadFile (a blank or too large file that had to be read to find out, passed
+    on so it isn't read again) or a list of ReadFile (a pack). Files that aren't
+    packed are passed through as soon as they are seen, so a pack may be
+    written after larger files that follow it in discovery order.
+    """
+    pack, pack_tokens = [], 0
+    for md_file in md_files:
+        # Files that are clearly too large are passed through without being read here
+        if os.path.getsize(md_file) > file_max_tokens * 8:
+            yield md_file
+            continue
+        
+        content = read_markdown_file(md_file)
+        if is_blank(content):
+            yield ReadFile(md_file, content, None)
+            continue
+        tokens = count_tokens(content)
+        if tokens > file_max_tokens:
+            yield ReadFile(md_file, content, tokens)
+            continue
+        
+        if pack and (pack_tokens + tokens > max_tokens or len(pack) >= max_files):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append(ReadFile(md_file, content, tokens))
+        pack_tokens += tokens
+    
+    if pack:
+        yield pack
+
+async def generate_dataset(md_files, llm, writer, concurrency=GENERATION_CONCURRENCY, timeout=GENERATION_TIMEOUT, cache=None, dedup=None,
+                           pack=PACK_SMALL_FILES):
+    """Generate Q&A pairs for all files concurrently.
+    
+    `md_files` can be a lazy iterator: files are scheduled as soon as they are
+    discovered, with a bounded window of scheduled-but-unwritten files so
+    memory stays flat on very large corpora. At most `concurrency` files (or
+    packs) and `concurrency` requests are in flight at once. Results are
+    awaited in input order and handed to the writer stage, so the output is
+    written in the same order as `md_files` regardless of which request
+    finishes first. With `pack`, small files are grouped by iter_work_units and
+    each pack is generated with a single request.
+    
+    Returns a (qa_count, file_count) tuple.
+    """
+    file_semaphore = asyncio.Semaphore(concurrency)
+    request_semaphore = asyncio.Semaphore(concurrency)
+    window = deque()
+    total_qa_count = 0
+    file_count = 0
+    
+    async def process_single(unit):
+        if isinstance(unit, ReadFile):
+            return [(unit.path, *await process_file(unit.path, llm, file_semaphore, request_semaphore, timeout, cache,
+                                                    content=unit.content, tokens=unit.tokens))]
+        return [(unit, *await process_file(unit, llm, file_semaphore, request_semaphore, timeout, cache))]
+    
+    async def write_oldest():
+        nonlocal total_qa_count, file_count
+        for md_file, status, file_qa_data, log, error in await window.popleft():
+            file_count += 1
+            
+            print(f"\nProcessed file {file_count}: {md_file}")
+            for line in log:
+                print(line)
+            
+            if dedup is not None and file_qa_data:
+                generated = len(file_qa_data)
+                file_qa_data = dedup.filter(file_qa_data)
+                if len(file_qa_data) < generated:
+                    print(f"  Dropped {generated - len(file_qa_data)} near-duplicate question(s)")
+            
+            await writer.awrite(file_qa_data, tag=(str(md_file), status, len(file_qa_data), error))
+            if file_qa_data:
+                total_qa_count += len(file_qa_data)
+                print(f"  ✅ Queued {len(file_qa_data)} Q&A pairs for writing")
+    
+    units = iter_work_units(md_files) if pack else md_files
+    for unit in units:
+        # Keep a few files queued behind the running ones, so a slow file doesn't stall the pipeline
+        if len(window) >= concurrency * 4:
+            await write_oldest()
+        if isinstance(unit, list):
+            task = asyncio.create_task(process_pack(unit, llm, file_semaphore, request_semaphore, timeout, cache))
+        else:
+            task = asyncio.create_task(process_single(unit))
+        window.append(task)
+        # Give the new task a chance to start before discovering the next file
+        await asyncio.sleep(0)
+    
+    while window:
+        await write_oldest()
+    
+    return total_qa_count, file_count
+
+def submit_batch(md_files, llm, backend, writer, cache=None):
+    """Write one structured-output request per file chunk and submit them as a batch.
+    
+    Chunks already in the generation cache are not submitted. Returns the batch
+    id, or None when there was nothing to submit.
+    """
+    Path(BATCH_DIR).mkdir(parents=True, exist_ok=True)
+    index = []
+    
+    def iter_requests():
+        for i, md_file in enumerate(md_files):
+            content = read_markdown_file(md_file)
+            if is_blank(content):
+                print(f"  Warning: {md_file} is empty, skipping...")
+                writer.write([], tag=(str(md_file), "skipped", 0, None))
+                continue
+            
+            chunks = chunk_markdown(content, CHUNK_MAX_TOKENS)
+            allocation = allocate_questions([count_tokens(chunk) for chunk in chunks], QUESTIONS_PER_FILE)
+            entry = {"source_file": str(md_file), "chunks": []}
+            for j, (chunk, n) in enumerate(zip(chunks, allocation)):
+                if n == 0:
+                    continue
+                custom_id = f"{i}-{j}"
+                cache_key = generation_cache_key(chunk, llm.model_name, llm.temperature, n)
+                entry["chunks"].append({"custom_id": custom_id, "num_questions": n, "cache_key": cache_key})
+                if cache is not None and cache_key in cache:
+                    continue
+                schema = question_answer_set_model(n).model_json_schema()
+                yield batch.build_request(custom_id, llm.model_name, build_prompt(chunk, n),
+                                          "QuestionAnswerSet", schema, temperature=llm.temperature)
+            index.append(entry)
+    
+    requests_path = Path(BATCH_DIR) / f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    count = batch.write_requests(iter_requests(), requests_path)
+    print(f"Wrote {count} batch request(s) for {len(index)} file(s) to {requests_path}")
+    
+    if count:
+        batch_id = backend.submit(str(requests_path))
+    else:
+        # Everything was cached, only the index is needed to ingest the results
+        requests_path.unlink()
+        batch_id = f"cached_{requests_path.stem}"
+    with open(Path(BATCH_DIR) / f"{batch_id}.index.json", 'w', encoding='utf-8') as file:
+        json.dump(index, file, ensure_ascii=False)
+    
+    if count:
+        print(f"Submitted batch {batch_id}")
+    return batch_id, count > 0
+
+def ingest_batch(batch_id, backend, llm, writer, cache=None, completed=frozenset(), dedup=None):
+    """Read batch results back into the dataset, in the original file order.
+    
+    Returns a (qa_count, file_count) tuple.
+    """
+    with open(Path(BATCH_DIR) / f"{batch_id}.index.json", 'r', encoding='utf-8') as file:
+        index = json.load(file)
+    
+    results = {}
+    if not batch_id.startswith("cached_"):
+        for line in backend.results(batch_id):
+            custom_id, content, error = batch.parse_result_line(line)
+            results[custom_id] = (content, error)
+    
+    total_qa_count = 0
+    file_count = 0
+    for entry in index:
+        source_file = entry["source_file"]
+        if source_file in completed:
+            continue
+        file_count += 1
+        
+        file_qa_data = []
+        error = None
+        for chunk in entry["chunks"]:
+            qa_set_model = question_answer_set_model(chunk["num_questions"])
+            cached = cache.get(chunk["cache_key"]) if cache is not None else None
+            try:
+                if cached is not None:
+                    qa_pairs = qa_set_model.model_validate(cached).qa_pairs
+                else:
+                    content, error = results.get(chunk["custom_id"], (None, "Missing from batch output"))
+                    if error is not None:
+                        break
+                    qa_pairs = qa_set_model.model_validate_json(content).qa_pairs
+                    if cache is not None:
+                        cache.set(chunk["cache_key"], {"qa_pairs": [qa.model_dump() for qa in qa_pairs]})
+            except Exception as e:
+                error = str(e)
+                break
+            
+            file_qa_data.extend({
+                'source_file': source_file,
+                'question': qa.question,
+                'answer': qa.answer
+            } for qa in qa_pairs)
+        
+        if error is not None:
+            print(f"  ❌ Error processing {source_file}: {error}")
+            writer.write([], tag=(source_file, "failed", 0, error))
+            continue
+        
+        if dedup is not None:
+            file_qa_data = dedup.filter(file_qa_data)
+        
+        writer.write(file_qa_data, tag=(source_file, "done", len(file_qa_data), None))
+        total_qa_count += len(file_qa_data)
+        print(f"  ✅ Queued {len(file_qa_data)} Q&A pairs from {source_file}")
+    
+    return total_qa_count, file_count
+
+def run_batch_generation(md_files, llm, writer, backend, cache=None, completed=frozenset(), batch_id=None,
+                         poll_interval=BATCH_POLL_INTERVAL, dedup=None):
+    """Generate the dataset through the offline batch API instead of synchronous calls."""
+    submitted = True
+    if batch_id is None:
+        batch_id, submitted = submit_batch(md_files, llm, backend, writer, cache)
+    
+    if submitted:
+        status = batch.wait_for_batch(backend, batch_id, poll_interval=poll_interval)
+        if status["status"] != "completed":
+            print(f"❌ Batch {batch_id} ended with status '{status['status']}', ingesting the available results")
+    
+    return ingest_batch(batch_id, backend, llm, writer, cache, completed, dedup)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic question-answer pairs from markdown files.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip files that finished in a previous run and append the missing ones")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only reprocess files that failed in a previous run")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit all requests to the offline batch API instead of calling the model directly")
+    parser.add_argument("--batch-id",
+                        help="Resume polling and ingest the results of a previously submitted batch")
+    parser.add_argument("--batch-backend", choices=["openai", "local"], default=BATCH_BACKEND,
+                        help="Batch endpoint to use; 'local' is a file-based stand-in for testing")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     print("Starting jdn-synthetic-dataset question generation...")
     
     # Check if OpenAI API key is set
@@ -87,80 +737,90 @@ def main():
     model_name = os.getenv('OPENAI_MODEL')  # Default to gpt-4o-mini
     llm = ChatOpenAI(
         model=model_name,
-        temperature=1
+        temperature=1,
+        # Retries are handled by the shared scheduler, which knows about the rate limits
+        max_retries=0
     )
     
     print(f"Using OpenAI model: {model_name}")
     
-    # Find all .md files in the files directory
-    files_dir = Path("files")
-    md_files = list(files_dir.glob("*.md"))
+    # Prepare output file (or shard directory)
+    output_path = output_path_for(OUTPUT_FORMAT)
     
-    if not md_files:
-        print("No .md files found in the 'files' directory.")
-        print("Please add some .md files to the 'files' directory and try again.")
-        return
+    # Create output directory if it doesn't exist
+    Path("./output").mkdir(exist_ok=True)
     
-    print(f"Found {len(md_files)} .md file(s) to process:")
-    for file in md_files:
-        print(f"  - {file}")
+    manifest = RunManifest(manifest_path_for(output_path))
+    resume = bool(args.resume or args.retry_failed or args.batch_id)
+    completed = frozenset(manifest.completed()) if resume else frozenset()
     
-    # Prepare output file
-    output_file = "./output/generated_questions_and_answers.csv"
+    if args.retry_failed:
+        # Only the failed files are needed, no need to walk the whole tree
+        md_files = (Path(source) for source in sorted(manifest.failed()) if Path(source).exists())
+    else:
+        # Stream .md files from the files directory as they are discovered
+        print(f"Discovering files in '{FILES_DIR}' (include: {', '.join(FILES_INCLUDE)}"
+              + (f", exclude: {', '.join(FILES_EXCLUDE)}" if FILES_EXCLUDE else "") + ")")
+        md_files = iter_documents(FILES_DIR, include=FILES_INCLUDE, exclude=FILES_EXCLUDE)
+        if resume:
+            md_files = (md_file for md_file in md_files if str(md_file) not in completed)
     
-    # Create output directory if it doesn't exist
-    Path("./output").mkdir(exist_ok=True)
+    first_file = next(md_files, None)
+    if first_file is None:
+        if resume:
+            print("Nothing to do, all files were already processed.")
+        else:
+            print(f"No .md files found in the '{FILES_DIR}' directory.")
+            print(f"Please add some .md files to the '{FILES_DIR}' directory and try again.")
+        return
+    md_files = itertools.chain([first_file], md_files)
     
-    # Write CSV header
-    write_header_to_csv(output_file)
-    print(f"Created output file: {output_file}")
+    if resume:
+        # Keep previous results and only process what is missing
+        print(f"Resuming {output_path}, skipping {len(completed)} finished file(s)")
+    else:
+        manifest.reset()
     
-    total_qa_count = 0
+    writer = open_dataset_writer(output_path, manifest, resume=resume)
+    print(f"Writing {OUTPUT_FORMAT} output to: {output_path}")
+    dedup = open_dedup_index(output_path, resume=resume)
     
-    # Process each markdown file
-    for i, md_file in enumerate(md_files, 1):
-        print(f"\nProcessing file {i}/{len(md_files)}: {md_file}")
-        
-        try:
-            # Read file content
-            content = read_markdown_file(md_file)
-            
-            if not content.strip():
-                print(f"  Warning: {md_file} is empty, skipping...")
-                continue
-            
-            print(f"  Content length: {len(content)} characters")
-            
-            # Generate Q&A pairs using structured output
-            print("  Generating questions and answers...")
-            qa_pairs = generate_questions_and_answers(content, llm)
-            
-            print(f"  Generated {len(qa_pairs)} Q&A pairs")
-            
-            # Convert to dict format and append to CSV immediately
-            file_qa_data = []
-            for qa in qa_pairs:
-                file_qa_data.append({
-                    'source_file': str(md_file),
-                    'question': qa.question,
-                    'answer': qa.answer
-                })
-            
-            # Append to CSV and flush
-            append_to_csv(file_qa_data, output_file)
-            total_qa_count += len(file_qa_data)
-            
-            print(f"  ✅ Saved {len(file_qa_data)} Q&A pairs to CSV")
-        
-        except Exception as e:
-            print(f"  ❌ Error processing {md_file}: {str(e)}")
-            continue
+    cache = open_generation_cache()
+    try:
+        if args.batch or args.batch_id:
+            print(f"Generating through the '{args.batch_backend}' batch backend")
+            backend = batch.get_backend(args.batch_backend)
+            total_qa_count, file_count = run_batch_generation(md_files, llm, writer, backend, cache=cache,
+                                                              completed=completed, batch_id=args.batch_id, dedup=dedup)
+        else:
+            print(f"Generating with up to {GENERATION_CONCURRENCY} concurrent request(s), {GENERATION_TIMEOUT:.0f}s budget per request (retries included), {CHUNK_MAX_TOKENS} tokens per chunk")
+            if PACK_SMALL_FILES:
+                print(f"Packing files of up to {PACK_FILE_MAX_TOKENS} tokens, {PACK_MAX_FILES} files / {PACK_MAX_TOKENS} tokens per request")
+            total_qa_count, file_count = asyncio.run(generate_dataset(md_files, llm, writer, cache=cache, dedup=dedup))
+    finally:
+        # Drain the writer so everything generated so far ends up on disk and in the manifest
+        writer.close()
+        manifest.close()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"\nGeneration cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['entries']} entries stored")
+            cache.close()
+        if not (args.batch or args.batch_id):
+            print("\nRequest scheduler:")
+            get_scheduler().print_metrics()
+        if dedup is not None:
+            dedup.write_report(DEDUP_REPORT_PATH)
+            print(f"Near-duplicates: dropped {dedup.rows_dropped} of {dedup.rows_seen} question(s), report saved to {DEDUP_REPORT_PATH}")
     
     if total_qa_count > 0:
-        print(f"\n🎉 Successfully generated {total_qa_count} Q&A pairs from {len(md_files)} file(s)!")
-        print(f"Results saved to: {output_file}")
+        print(f"\n🎉 Successfully generated {total_qa_count} Q&A pairs from {file_count} file(s)!")
+        print(f"Results saved to: {output_path}")
     else:
         print("\n❌ No Q&A pairs were generated.")
+    
+    failed = manifest.failed()
+    if failed:
+        print(f"⚠️  {len(failed)} file(s) failed, rerun with --retry-failed to retry only those")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+"""
+Run manifest for resumable dataset generation.
+
+The manifest is an append-only JSONL file next to the output dataset. Every
+processed source file gets a record with its status ("done", "skipped" or
+"failed") and, for successful files, the output position right after its rows
+were written (see `writer.DatasetWriter`). The latest record for a source file
+wins, so retried files simply append a new record.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+COMPLETED_STATUSES = ("done", "skipped")
+
+
+class RunManifest:
+    """Tracks which source files of a generation run finished or failed."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._position: Optional[Dict[str, Any]] = None
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line behind
+                    continue
+                self.entries[record["source_file"]] = record
+                if record.get("position") is not None:
+                    self._position = record["position"]
+
+    def reset(self):
+        """Start a fresh manifest, forgetting all previous records."""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding='utf-8')
+        self.entries = {}
+        self._position = None
+
+    def record(self, source_file: str, status: str, rows: int = 0, error: Optional[str] = None,
+               position: Optional[Dict[str, Any]] = None, sync: bool = True):
+        """Append a status record for a source file.
+        
+        With sync=False the record is only flushed; call `sync()` after a
+        group of records to make them durable with a single fsync.
+        """
+        record = {
+            "source_file": source_file,
+            "status": status,
+            "rows": rows,
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+        }
+        if error is not None:
+            record["error"] = error
+        if position is not None:
+            record["position"] = position
+            self._position = position
+
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+        self.entries[source_file] = record
+
+    def sync(self):
+        """Make all records written so far durable."""
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def completed(self) -> Set[str]:
+        """Source files that finished successfully (including empty files)."""
+        return {source for source, record in self.entries.items() if record["status"] in COMPLETED_STATUSES}
+
+    def failed(self) -> Set[str]:
+        """Source files whose latest attempt failed."""
+        return {source for source, record in self.entries.items() if record["status"] == "failed"}
+
+    def position(self) -> Optional[Dict[str, Any]]:
+        """Output position up to which all written rows are accounted for."""
+        return self._position
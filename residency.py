@@ -0,0 +1,164 @@
+"""
+Model-residency-aware scheduling for a shared Ollama host.
+
+An Ollama host keeps a limited number of models in memory. A request for a
+model that is not loaded evicts another one and waits until the new weights
+are loaded, which takes tens of seconds for a 70B model, so interleaving
+candidate and judge calls pays for a swap on almost every request.
+
+eval-langfuse.py therefore runs its work grouped by model (`group_by_model`)
+and switches models explicitly with `ModelResidency.switch_to`:
+
+- the previous model is unloaded (`keep_alive: 0`), so the next one loads into
+  free memory instead of waiting for an eviction,
+- the new model is loaded with a warm-up request (a /api/generate call without
+  a prompt) whose `keep_alive` keeps it resident for the whole group, also when
+  there are gaps between the requests.
+
+Swaps, loads and the load time reported by Ollama (`load_duration`) are
+counted per model. Configured with environment variables:
+
+- OLLAMA_URL: native Ollama API (defaults to OPENAI_OLLAMA_URL without /v1)
+- OLLAMA_KEEP_ALIVE: how long a warmed-up model stays loaded (default 30m)
+- OLLAMA_UNLOAD_AFTER_GROUP: set to 0 to leave a model loaded after its group
+- OLLAMA_WARMUP_TIMEOUT: seconds to wait for a model to load (default 600)
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from scheduler import get_scheduler
+
+T = TypeVar("T")
+
+
+def group_by_model(tasks: Iterable[T], model_of: Callable[[T], str]) -> List[Tuple[str, List[T]]]:
+    """Group tasks by model, in the order the models first appear and keeping the task order per model."""
+    groups: Dict[str, List[T]] = {}
+    for task in tasks:
+        groups.setdefault(model_of(task), []).append(task)
+    return list(groups.items())
+
+
+def ollama_url_from_env() -> str:
+    """Base URL of the native Ollama API (the one serving /api/generate and /api/ps)."""
+    url = os.getenv("OLLAMA_URL")
+    if url:
+        return url.rstrip("/")
+    url = os.getenv("OPENAI_OLLAMA_URL", "http://lxc-ai01:3000/ollama/v1").rstrip("/")
+    return url[:-len("/v1")] if url.endswith("/v1") else url
+
+
+class ModelResidency:
+    """Loads and unloads models on an Ollama host explicitly and counts the swaps."""
+
+    def __init__(self, base_url: str, keep_alive: str = "30m", unload_after_group: bool = True,
+                 timeout: float = 600.0, api_key: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.unload_after_group = unload_after_group
+        self.timeout = timeout
+        self.api_key = api_key
+        self.current: Optional[str] = None
+        self.swaps = 0
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModelResidency":
+        return cls(
+            base_url=ollama_url_from_env(),
+            keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+            unload_after_group=os.getenv("OLLAMA_UNLOAD_AFTER_GROUP", "1") != "0",
+            timeout=float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "600")),
+            api_key=os.getenv("OPENAI_API_KEY"),
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _model_stats(self, model: str) -> Dict[str, float]:
+        return self.stats.setdefault(model, {"loads": 0, "load_time_s": 0.0, "warmups": 0, "warmup_s": 0.0,
+                                             "unloads": 0})
+
+    def _generate(self, model: str, keep_alive) -> dict:
+        import requests
+
+        url = self.base_url + "/api/generate"
+
+        def send():
+            # Without a prompt Ollama only loads (or, with keep_alive 0, unloads) the model
+            response = requests.post(url, json={"model": model, "keep_alive": keep_alive},
+                                     headers=self._headers(), timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return get_scheduler().run(send, endpoint=url, model=model)
+
+    def loaded_models(self) -> Optional[Set[str]]:
+        """Models currently loaded on the host according to /api/ps, or None if the host doesn't tell."""
+        import requests
+
+        try:
+            response = requests.get(self.base_url + "/api/ps", headers=self._headers(), timeout=30)
+            response.raise_for_status()
+            return {model.get("name") or model.get("model") for model in response.json().get("models", [])}
+        except (requests.RequestException, ValueError):
+            return None
+
+    def warm_up(self, model: str):
+        """Load `model` and keep it resident for keep_alive; cheap when it is loaded already."""
+        loaded = self.loaded_models()
+        start = time.monotonic()
+        response = self._generate(model, self.keep_alive)
+        elapsed = time.monotonic() - start
+        # Nanoseconds spent loading the weights
+        load_time = response.get("load_duration", 0) / 1e9
+        was_loaded = model in loaded if loaded is not None else load_time < 1.0
+
+        stats = self._model_stats(model)
+        stats["warmups"] += 1
+        stats["warmup_s"] += elapsed
+        if not was_loaded:
+            stats["loads"] += 1
+            stats["load_time_s"] += load_time
+
+    def unload(self, model: str):
+        self._generate(model, 0)
+        self._model_stats(model)["unloads"] += 1
+
+    def switch_to(self, model: str):
+        """Make `model` the resident model before running its group of requests."""
+        with self._lock:
+            if model == self.current:
+                return
+            previous = self.current
+            self.current = model
+            if previous is not None:
+                self.swaps += 1
+            # Failing to manage residency only costs time, the requests themselves still load the model
+            try:
+                if previous is not None and self.unload_after_group:
+                    self.unload(previous)
+                self.warm_up(model)
+            except Exception as e:
+                print(f"Could not switch the Ollama host from {previous} to {model}: {e}")
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "swaps": self.swaps,
+                "load_time_s": round(sum(stats["load_time_s"] for stats in self.stats.values()), 3),
+                "models": {model: dict(stats, load_time_s=round(stats["load_time_s"], 3),
+                                       warmup_s=round(stats["warmup_s"], 3))
+                           for model, stats in self.stats.items()},
+            }
+
+    def print_metrics(self):
+        metrics = self.metrics()
+        print(f"  {metrics['swaps']} model swaps, {metrics['load_time_s']:.1f}s loading models")
+        for model, stats in metrics["models"].items():
+            print(f"  {model}: loaded {stats['loads']}x in {stats['load_time_s']:.1f}s, "
+                  f"{stats['warmups']} warm-ups ({stats['warmup_s']:.1f}s), {stats['unloads']} unloads")
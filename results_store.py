@@ -0,0 +1,322 @@
+"""
+Durable, incremental store of evaluation results backed by SQLite.
+
+Every evaluated row is written as soon as it completes, keyed by evaluation
+run, model and question: first the model's answer, its latency and token F1
+(while the model is still answering other questions), then the per-row metric
+scores once MLflow scored the model's batch. A crash therefore loses at most
+the rows that were in flight, and a resumed run (`EVAL_RESUME`) only
+evaluates the rows of a model that are not scored yet.
+
+The summary and the per-model CSVs are queries over the store, so they can be
+regenerated at any time, also for an interrupted run:
+
+    python results_store.py                  # latest run
+    python results_store.py --run 20250101_120000 --output-dir ./output/evaluations
+    python results_store.py --list
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from sampling import bootstrap_ci
+
+# Per-row metrics whose bootstrap confidence interval is part of the model metrics
+CI_METRICS = ("token_f1", "latency", "toxicity/v1")
+# Columns of the per-model CSV besides the metric scores
+BASE_COLUMNS = ["inputs", "ground_truth", "source_file", "outputs", "latency", "token_f1"]
+
+
+def score_base(column: str) -> str:
+    """Metric name of a per-row score column: "toxicity/v1/score" -> "toxicity/v1"."""
+    return column[:-len("/score")] if column.endswith("/score") else column
+
+
+class ResultsStore:
+    """Evaluation rows and per-model run status in a SQLite file, safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS models (
+                run_id TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                model TEXT,
+                mlflow_run_id TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                rows_available INTEGER,
+                aggregates TEXT NOT NULL DEFAULT '{}',
+                aggregate_rows INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, model_name)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                run_id TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                question TEXT NOT NULL,
+                ground_truth TEXT,
+                source_file TEXT,
+                output TEXT,
+                latency REAL,
+                token_f1 REAL,
+                scores TEXT,
+                scored INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, model_name, question)
+            )
+            """
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def latest_run(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT run_id FROM models ORDER BY started_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """All runs with their number of models and scored rows, latest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT m.run_id, COUNT(*), SUM(m.status = 'done'), MIN(m.started_at),
+                       (SELECT COUNT(*) FROM results r WHERE r.run_id = m.run_id AND r.scored = 1)
+                FROM models m GROUP BY m.run_id ORDER BY MIN(m.started_at) DESC
+                """
+            ).fetchall()
+        return [{"run_id": run_id, "models": models, "models_done": done, "started_at": started, "rows_scored": scored}
+                for run_id, models, done, started, scored in rows]
+
+    def start_model(self, run_id: str, model_name: str, model: str, mlflow_run_id: Optional[str],
+                    rows_available: int):
+        """Mark a model as running; keeps the aggregates of earlier attempts of the same run."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO models (run_id, model_name, model, mlflow_run_id, status, rows_available, started_at, updated_at)
+                VALUES (?, ?, ?, ?, 'running', ?, ?, ?)
+                ON CONFLICT (run_id, model_name) DO UPDATE SET
+                    model = excluded.model, mlflow_run_id = excluded.mlflow_run_id, status = 'running',
+                    error = NULL, rows_available = excluded.rows_available, updated_at = excluded.updated_at
+                """,
+                (run_id, model_name, model, mlflow_run_id, rows_available, now, now),
+            )
+
+    def finish_model(self, run_id: str, model_name: str, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE models SET status = ?, error = ?, updated_at = ? WHERE run_id = ? AND model_name = ?",
+                ("failed" if error else "done", error, time.time(), run_id, model_name),
+            )
+
+    def record_prediction(self, run_id: str, model_name: str, question: str, ground_truth: Optional[str],
+                          source_file: Optional[str], output: Optional[str], latency: float, token_f1: float):
+        """Store a model answer as soon as it is available; its metric scores follow in record_scores()."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO results (run_id, model_name, question, ground_truth, source_file, output, latency, token_f1, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, model_name, question) DO UPDATE SET
+                    output = excluded.output, latency = excluded.latency, token_f1 = excluded.token_f1,
+                    scores = NULL, scored = 0, updated_at = excluded.updated_at
+                """,
+                (run_id, model_name, question, ground_truth, source_file, output, latency, token_f1, time.time()),
+            )
+
+    def record_scores(self, run_id: str, model_name: str, questions: Sequence[str],
+                      scores: Sequence[Dict[str, float]]):
+        """Attach the per-row metric scores of a scored batch and mark its rows as scored, in one transaction."""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE results SET scores = ?, scored = 1, updated_at = ? WHERE run_id = ? AND model_name = ? AND question = ?",
+                    [(json.dumps(row_scores), now, run_id, model_name, question)
+                     for question, row_scores in zip(questions, scores)],
+                )
+
+    def merge_aggregates(self, run_id: str, model_name: str, metrics: Dict[str, Any], rows: int):
+        """Fold the aggregate metrics of a scored batch into the model's, weighted by rows.
+
+        Only metrics without per-row scores (e.g. exact_match/v1) rely on this;
+        everything with per-row scores is recomputed from the rows.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT aggregates, aggregate_rows FROM models WHERE run_id = ? AND model_name = ?",
+                (run_id, model_name),
+            ).fetchone()
+            previous, previous_rows = (json.loads(row[0]), row[1]) if row else ({}, 0)
+            merged = dict(previous)
+            for name, value in metrics.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                if name in previous and previous_rows:
+                    merged[name] = (previous[name] * previous_rows + value * rows) / (previous_rows + rows)
+                else:
+                    merged[name] = value
+            self._conn.execute(
+                "UPDATE models SET aggregates = ?, aggregate_rows = ?, updated_at = ? WHERE run_id = ? AND model_name = ?",
+                (json.dumps(merged), previous_rows + rows, time.time(), run_id, model_name),
+            )
+
+    def scored_questions(self, run_id: str, model_name: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question FROM results WHERE run_id = ? AND model_name = ? AND scored = 1",
+                (run_id, model_name),
+            ).fetchall()
+        return {question for (question,) in rows}
+
+    def model_names(self, run_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model_name FROM models WHERE run_id = ? ORDER BY started_at", (run_id,)
+            ).fetchall()
+        return [name for (name,) in rows]
+
+    def model_status(self, run_id: str, model_name: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT model, mlflow_run_id, status, error, rows_available FROM models WHERE run_id = ? AND model_name = ?",
+                (run_id, model_name),
+            ).fetchone()
+        if row is None:
+            return {}
+        return dict(zip(("model", "mlflow_run_id", "status", "error", "rows_available"), row))
+
+    def model_rows(self, run_id: str, model_name: str, scored_only: bool = False):
+        """The rows of a model as a DataFrame in the per-model CSV layout, in insertion order."""
+        import pandas as pd
+
+        query = ("SELECT question, ground_truth, source_file, output, latency, token_f1, scores FROM results "
+                 "WHERE run_id = ? AND model_name = ?" + (" AND scored = 1" if scored_only else "") + " ORDER BY rowid")
+        with self._lock:
+            rows = self._conn.execute(query, (run_id, model_name)).fetchall()
+        frame = pd.DataFrame([row[:6] for row in rows], columns=BASE_COLUMNS)
+        scores = pd.DataFrame([json.loads(row[6]) if row[6] else {} for row in rows], index=frame.index)
+        return pd.concat([frame, scores], axis=1)
+
+    def model_metrics(self, run_id: str, model_name: str, confidence: float = 0.95, seed: int = 0) -> Dict[str, Any]:
+        """Aggregate metrics of a model over its scored rows, like the ones mlflow.evaluate reports.
+
+        Per-row metrics get mean, variance and p90 (and token F1 its mean),
+        CI_METRICS get bootstrap confidence intervals, and metrics without
+        per-row scores come from the merged MLflow aggregates.
+        """
+        import numpy as np
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT aggregates, rows_available FROM models WHERE run_id = ? AND model_name = ?",
+                (run_id, model_name),
+            ).fetchone()
+        aggregates, rows_available = (json.loads(row[0]), row[1]) if row else ({}, None)
+        frame = self.model_rows(run_id, model_name, scored_only=True)
+
+        metrics: Dict[str, Any] = dict(aggregates)
+        columns = {"latency": "latency", "token_f1": "token_f1"}
+        columns.update({score_base(column): column for column in frame.columns if column not in BASE_COLUMNS})
+        for name, column in columns.items():
+            values = frame[column].astype(float).dropna().to_numpy()
+            if len(values) == 0:
+                continue
+            metrics[f"{name}/mean"] = float(values.mean())
+            if name != "token_f1":
+                metrics[f"{name}/variance"] = float(values.var())
+                metrics[f"{name}/p90"] = float(np.percentile(values, 90))
+            if name in CI_METRICS:
+                _, low, high = bootstrap_ci(values, confidence, seed=seed)
+                metrics[f"{name}/ci_low"] = low
+                metrics[f"{name}/ci_high"] = high
+        metrics["rows_used"] = len(frame)
+        metrics["rows_available"] = rows_available if rows_available is not None else len(frame)
+        return metrics
+
+    def export_model_csv(self, run_id: str, model_name: str, path) -> Path:
+        """Write all rows of a model (scored or not yet scored) to a CSV file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_rows(run_id, model_name).to_csv(path, index=False)
+        return path
+
+    def summary(self, run_id: str, output_dir, confidence: float = 0.95, seed: int = 0,
+                model_names: Optional[Iterable[str]] = None):
+        """Summary DataFrame of a run, one row per model; also (re)writes the per-model CSVs to output_dir."""
+        import pandas as pd
+
+        output_dir = Path(output_dir)
+        summary_data = []
+        for model_name in model_names or self.model_names(run_id):
+            status = self.model_status(run_id, model_name)
+            row = {"model_name": model_name}
+            if status.get("status") == "failed":
+                row["error"] = status["error"]
+            else:
+                row.update(self.model_metrics(run_id, model_name, confidence, seed))
+                row["status"] = status.get("status")
+                row["csv_path"] = str(self.export_model_csv(run_id, model_name,
+                                                            output_dir / f"{model_name}_evaluation_results.csv"))
+            row["run_id"] = status.get("mlflow_run_id")
+            row["evaluation_run"] = run_id
+            summary_data.append(row)
+        return pd.DataFrame(summary_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate evaluation reports from the results store")
+    parser.add_argument("--path", default="./output/evaluations/results.sqlite", help="Results store")
+    parser.add_argument("--run", default="latest", help="Evaluation run to report on")
+    parser.add_argument("--output-dir", default="./output/evaluations", help="Directory of the CSV reports")
+    parser.add_argument("--list", action="store_true", help="List the stored runs")
+    args = parser.parse_args(argv)
+
+    if not Path(args.path).exists():
+        print(f"❌ No results store at {args.path}")
+        return 1
+    store = ResultsStore(args.path)
+    try:
+        if args.list:
+            for run in store.runs():
+                print(f"{run['run_id']}: {run['models_done']}/{run['models']} models done, {run['rows_scored']} rows scored")
+            return 0
+
+        run_id = store.latest_run() if args.run == "latest" else args.run
+        if run_id is None:
+            print("❌ The results store has no runs")
+            return 1
+        summary_df = store.summary(run_id, args.output_dir)
+        summary_path = Path(args.output_dir) / "evaluation_summary.csv"
+        summary_df.to_csv(summary_path, index=False)
+        print(f"📄 Summary report of run {run_id} saved to: {summary_path}")
+        print(summary_df.to_string(index=False))
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
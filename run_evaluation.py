@@ -15,8 +15,8 @@ def main():
     print("🔬 MLflow Model Evaluation Runner")
     print("="*50)
     
-    # Check if the CSV file exists
-    csv_path = "./output/generated_questions_and_answers.csv"
+    # Check if the CSV file (or shard directory) exists
+    csv_path = os.getenv("EVAL_DATA_PATH", "./output/generated_questions_and_answers.csv")
     if not os.path.exists(csv_path):
         print(f"❌ Error: {csv_path} not found!")
         print("Please run main.py first to generate the question-answer dataset.")
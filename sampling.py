@@ -0,0 +1,133 @@
+"""
+Sampling and stopping rules for sequential evaluation.
+
+Instead of running every row through every model, rows are evaluated in a
+stratified order (every prefix contains the source files in proportion to
+their share of the dataset) and in rounds. After each round the bootstrap
+confidence interval of a per-row metric is computed for every model; a model
+stops once its interval no longer overlaps with any other model's, i.e. once
+its place in the ranking is statistically settled.
+"""
+
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def stratified_order(strata: Sequence[str], seed: int = 0) -> List[int]:
+    """Order row indices so that every prefix is a proportional stratified sample.
+
+    Rows are shuffled within their stratum, and the k-th row of a stratum with n
+    rows is placed at position (k + u) / n with u uniform in [0, 1). Sorting on
+    that position interleaves the strata proportionally to their size.
+    """
+    # Imported here so that importing eval.py doesn't load numpy
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    groups = defaultdict(list)
+    for index, stratum in enumerate(strata):
+        groups[stratum].append(index)
+
+    keyed = []
+    for indices in groups.values():
+        indices = rng.permutation(indices)
+        positions = (np.arange(len(indices)) + rng.random(len(indices))) / len(indices)
+        keyed.extend(zip(positions.tolist(), indices.tolist()))
+    keyed.sort()
+    return [index for _, index in keyed]
+
+
+def stratified_sample(strata: Sequence[str], size: int, seed: int = 0) -> List[int]:
+    """Indices of a proportional stratified sample of `size` rows, in dataset order."""
+    return sorted(stratified_order(strata, seed)[:size])
+
+
+def token_f1(prediction: Optional[str], target: Optional[str]) -> float:
+    """Token overlap F1 between a prediction and the ground truth (SQuAD style, case-insensitive)."""
+    predicted = _TOKEN_RE.findall((prediction or "").lower())
+    expected = _TOKEN_RE.findall((target or "").lower())
+    if not predicted or not expected:
+        return float(predicted == expected)
+    common = sum((Counter(predicted) & Counter(expected)).values())
+    if common == 0:
+        return 0.0
+    precision = common / len(predicted)
+    recall = common / len(expected)
+    return 2 * precision * recall / (precision + recall)
+
+
+def bootstrap_ci(values: Sequence[float], confidence: float = 0.95, num_resamples: int = 1000,
+                 seed: int = 0) -> Tuple[float, float, float]:
+    """Mean and percentile bootstrap confidence interval of the mean: (mean, low, high)."""
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return float("nan"), float("nan"), float("nan")
+    if len(values) == 1:
+        return float(values[0]), float(values[0]), float(values[0])
+
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(num_resamples, len(values)))].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(values.mean()), float(low), float(high)
+
+
+class SequentialRanking:
+    """Tracks a per-row metric for several models and decides when each can stop.
+
+    A model is settled when its confidence interval does not overlap with the
+    interval of any other model, or, when it is the only model, once the
+    interval is narrower than `precision`. Models stop at `max_rows` at the
+    latest and are never stopped before `min_rows`.
+    """
+
+    def __init__(self, models: Sequence[str], min_rows: int = 50, max_rows: Optional[int] = None,
+                 confidence: float = 0.95, precision: float = 0.02, num_resamples: int = 1000, seed: int = 0):
+        self.models = list(models)
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.confidence = confidence
+        self.precision = precision
+        self.num_resamples = num_resamples
+        self.seed = seed
+        self.values: Dict[str, List[float]] = {model: [] for model in self.models}
+        self.settled: Dict[str, bool] = {model: False for model in self.models}
+
+    def add(self, model: str, values: Sequence[float]):
+        self.values[model].extend(float(value) for value in values)
+
+    def interval(self, model: str) -> Tuple[float, float, float]:
+        return bootstrap_ci(self.values[model], self.confidence, self.num_resamples, self.seed)
+
+    def active(self) -> List[str]:
+        return [model for model in self.models if not self.settled[model]]
+
+    def update(self) -> List[str]:
+        """Re-evaluate the stopping rule; returns the models that settled in this update."""
+        intervals = {model: self.interval(model) for model in self.models}
+        newly_settled = []
+        for model in self.active():
+            rows = len(self.values[model])
+            if self.max_rows is not None and rows >= self.max_rows:
+                settled = True
+            elif rows < self.min_rows:
+                settled = False
+            elif len(self.models) == 1:
+                _, low, high = intervals[model]
+                settled = (high - low) / 2 <= self.precision
+            else:
+                _, low, high = intervals[model]
+                # Models without any values (e.g. failed ones) don't take part in the ranking
+                settled = all(high < other_low or low > other_high
+                              for other, (_, other_low, other_high) in intervals.items()
+                              if other != model and self.values[other])
+            if settled:
+                self.settled[model] = True
+                newly_settled.append(model)
+        return newly_settled
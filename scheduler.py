@@ -0,0 +1,318 @@
+"""
+Shared rate-limit-aware request scheduler.
+
+Every LLM call in main.py, eval.py and eval-langfuse.py goes through a
+`RequestScheduler`. Per (endpoint, model) it enforces a requests-per-minute and
+a tokens-per-minute budget with token buckets, and retries throttled or failed
+calls with jittered exponential backoff that honors `Retry-After`.
+
+The buckets work by reservation: a caller takes its tokens immediately (the
+bucket may go negative) and sleeps for the time it takes to refill the deficit.
+That keeps callers in FIFO order and works the same for threads (`run`) and
+asyncio tasks (`arun`).
+
+Limits are configured with environment variables:
+
+- RATE_LIMIT_RPM / RATE_LIMIT_TPM: default budgets for every endpoint/model
+- RATE_LIMITS: JSON object with per-model overrides, e.g.
+  {"gpt-4.1-nano": {"rpm": 500, "tpm": 200000}, "llama3.3:70b": {"rpm": 20}}
+- RATE_LIMIT_MAX_RETRIES, RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX
+- SCHEDULER_METRICS_PATH: write the metrics and all call latencies to this
+  JSON file when the process exits (used by benchmarks/throughput.py)
+"""
+
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+RETRIABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    """HTTP status of an openai/httpx/requests error, if it carries one."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """Seconds to wait according to the Retry-After header of an error response."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retriable(error: BaseException) -> bool:
+    """Throttling, server errors, timeouts and dropped connections are worth retrying."""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRIABLE_STATUS_CODES
+    # asyncio.TimeoutError is an alias of TimeoutError on Python 3.11+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # openai.APITimeoutError / APIConnectionError, requests Timeout / ConnectionError, httpx transport errors
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name or name in ("RemoteProtocolError", "ReadError", "ConnectError",
+                                                                 "WriteError")
+
+
+def latency_percentiles(latencies: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 (nearest rank) of call latencies in seconds."""
+    if not latencies:
+        return {"p50_s": 0.0, "p95_s": 0.0, "p99_s": 0.0}
+    ordered = sorted(latencies)
+    return {f"p{q}_s": round(ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)], 3)
+            for q in (50, 95, 99)}
+
+
+class _Limiter:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.stats = {
+            "requests": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "throttled": 0,
+            "throttle_wait_s": 0.0,
+            "rate_limited_responses": 0,
+            "queued": 0,
+            "in_flight": 0,
+            "max_queued": 0,
+        }
+        # Seconds from the call until its successful result, including throttling and retries
+        self.latencies: List[float] = []
+
+    def reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+
+class RequestScheduler:
+    """Enforces per-endpoint/model budgets and retries LLM calls with backoff."""
+
+    def __init__(self, default_rpm: Optional[float] = None, default_tpm: Optional[float] = None,
+                 limits: Optional[Dict[str, Dict[str, float]]] = None, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._limiters: Dict[Tuple[str, str], _Limiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        def number(name):
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        return cls(
+            default_rpm=number("RATE_LIMIT_RPM"),
+            default_tpm=number("RATE_LIMIT_TPM"),
+            limits=json.loads(os.getenv("RATE_LIMITS", "{}")),
+            max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5")),
+            backoff_base=float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1")),
+            backoff_max=float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "60")),
+        )
+
+    def _limiter(self, endpoint: str, model: str) -> _Limiter:
+        key = (endpoint or "", model or "")
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                override = self.limits.get(model, {})
+                limiter = _Limiter(override.get("rpm", self.default_rpm), override.get("tpm", self.default_tpm))
+                self._limiters[key] = limiter
+            return limiter
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = retry_after_of(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max) + random.uniform(0, self.backoff_base)
+        # Full jitter: uniform between 0 and the exponential ceiling
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _enter_queue(self, limiter: _Limiter, tokens: int) -> float:
+        with self._lock:
+            stats = limiter.stats
+            stats["queued"] += 1
+            stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        wait = limiter.reserve(tokens)
+        if wait > 0:
+            with self._lock:
+                limiter.stats["throttled"] += 1
+                limiter.stats["throttle_wait_s"] += wait
+        return wait
+
+    def _update(self, limiter: _Limiter, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                limiter.stats[name] += delta
+
+    def _succeeded(self, limiter: _Limiter, latency: float):
+        with self._lock:
+            limiter.stats["succeeded"] += 1
+            limiter.latencies.append(latency)
+
+    def _on_error(self, limiter: _Limiter, error: BaseException, attempt: int) -> Optional[float]:
+        """Return the backoff delay for a retriable error, or None to give up."""
+        if status_code_of(error) == 429:
+            self._update(limiter, rate_limited_responses=1)
+        if attempt >= self.max_retries or not is_retriable(error):
+            self._update(limiter, failed=1)
+            return None
+        self._update(limiter, retries=1)
+        return self._backoff(attempt, error)
+
+    def run(self, fn: Callable[[], Any], endpoint: str = "", model: str = "", tokens: int = 0) -> Any:
+        """Call fn() within the budget of (endpoint, model), retrying on throttling and transient errors."""
+        limiter = self._limiter(endpoint, model)
+        self._update(limiter, requests=1)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            wait = self._enter_queue(limiter, tokens)
+            if wait > 0:
+                time.sleep(wait)
+            self._update(limiter, queued=-1, in_flight=1)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._on_error(limiter, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                self._update(limiter, in_flight=-1)
+            self._succeeded(limiter, time.monotonic() - started)
+            return result
+
+    async def arun(self, fn: Callable[[], Awaitable[Any]], endpoint: str = "", model: str = "", tokens: int = 0) -> Any:
+        """Async variant of run(); fn must return a fresh awaitable on every call."""
+        # Imported here so the thread-based entry points don't pay for asyncio at startup
+        import asyncio
+
+        limiter = self._limiter(endpoint, model)
+        self._update(limiter, requests=1)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            wait = self._enter_queue(limiter, tokens)
+            if wait > 0:
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:
+                    # The caller's overall timeout expired while the call was throttled
+                    self._update(limiter, queued=-1)
+                    raise
+            self._update(limiter, queued=-1, in_flight=1)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._on_error(limiter, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                self._update(limiter, in_flight=-1)
+            self._succeeded(limiter, time.monotonic() - started)
+            return result
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per endpoint/model counters, queue depth, time spent throttled and call latency percentiles."""
+        with self._lock:
+            return {
+                f"{model}@{endpoint}" if endpoint else model: dict(limiter.stats, throttle_wait_s=round(limiter.stats["throttle_wait_s"], 3),
+                                                                   **latency_percentiles(limiter.latencies))
+                for (endpoint, model), limiter in self._limiters.items()
+            }
+
+    def latencies(self) -> List[float]:
+        """Latencies of all successful calls, over all endpoints and models."""
+        with self._lock:
+            return [latency for limiter in self._limiters.values() for latency in limiter.latencies]
+
+    def print_metrics(self):
+        for key, stats in self.metrics().items():
+            print(f"  {key}: {stats['succeeded']}/{stats['requests']} succeeded, {stats['retries']} retries, "
+                  f"{stats['rate_limited_responses']} rate-limited responses, throttled {stats['throttled']}x "
+                  f"for {stats['throttle_wait_s']:.1f}s, max queue depth {stats['max_queued']}, "
+                  f"latency p50 {stats['p50_s']:.2f}s / p95 {stats['p95_s']:.2f}s")
+
+    def dump(self, path: str):
+        """Write the metrics and all call latencies to a JSON file."""
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"metrics": self.metrics(), "latencies": self.latencies()}, file)
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Process-wide scheduler configured from the environment."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler.from_env()
+            metrics_path = os.getenv("SCHEDULER_METRICS_PATH")
+            if metrics_path:
+                atexit.register(_scheduler.dump, metrics_path)
+        return _scheduler
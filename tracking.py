@@ -0,0 +1,338 @@
+"""
+Asynchronous, batched experiment-tracking writer.
+
+Logging a parameter or metric to MLflow is a round trip to the tracking
+server, and eval.py logged every value separately from the evaluation
+threads. `TrackingWriter` takes those calls off the critical path: callers
+put params and metrics on a bounded queue and return immediately. A
+background thread
+
+- coalesces the params and metrics of each MLflow run into `log_batch` calls
+  (at most 100 params and 1000 values per call, the MLflow limits),
+- sends them every `flush_interval` seconds, when a batch is full, on
+  `flush()` and at shutdown,
+- keeps them when the tracking server is unavailable and retries with
+  exponential backoff; values that the server rejects (e.g. a param logged
+  twice with different values) are dropped and counted.
+
+When the server stays down long enough for the pending values and the queue to
+fill up, callers wait up to `put_timeout` seconds for room, after which the
+value is dropped and counted rather than blocking inference.
+
+Langfuse clients already batch their events by count (LANGFUSE_FLUSH_AT) and
+by time (LANGFUSE_FLUSH_INTERVAL) on background threads, but their queue
+silently drops events when it is full, and an explicit `flush()` blocks until
+everything was sent. `LangfuseBuffer` replaces the explicit flushes: callers
+await `wait_for_room()` before producing more events, which holds them back
+while more than `max_pending` events are waiting, and `close()` makes the one
+blocking flush when the run ends (or at exit).
+
+Configured with environment variables:
+
+- TRACKING_FLUSH_INTERVAL: seconds between batches (default 2)
+- TRACKING_QUEUE_SIZE: bound of the queue and of the pending values (default 10000)
+- TRACKING_SHUTDOWN_TIMEOUT: seconds to wait for the final flush at exit (default 30)
+- LANGFUSE_MAX_PENDING: Langfuse events that may wait for upload before callers are held back (default 10000)
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Limits of a single MLflow log_batch request
+MAX_PARAMS_PER_BATCH = 100
+MAX_VALUES_PER_BATCH = 1000
+# MLflow error codes for requests that will never succeed when retried
+PERMANENT_ERROR_CODES = {"INVALID_PARAMETER_VALUE", "RESOURCE_DOES_NOT_EXIST", "INVALID_STATE", "BAD_REQUEST"}
+# Seconds to wait for the final flush
+TRACKING_SHUTDOWN_TIMEOUT = float(os.getenv("TRACKING_SHUTDOWN_TIMEOUT", "30"))
+
+
+def is_permanent(error: BaseException) -> bool:
+    """Whether a failed tracking request was rejected (retrying won't help) rather than not delivered."""
+    return getattr(error, "error_code", None) in PERMANENT_ERROR_CODES
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+        self.delivered = False
+
+
+class TrackingWriter:
+    """Delivers MLflow params and metrics in batches from a background thread."""
+
+    def __init__(self, flush_interval: float = 2.0, max_queue: int = 10000, put_timeout: float = 5.0,
+                 backoff_max: float = 60.0, client_factory: Optional[Callable[[], Any]] = None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_queue
+        self.put_timeout = put_timeout
+        self.backoff_max = backoff_max
+        self.client_factory = client_factory
+        self.stats = {"params": 0, "metrics": 0, "batches": 0, "retries": 0, "rejected": 0, "dropped": 0}
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._client = None
+        # run_id -> {key: value} and run_id -> [(key, value, timestamp_ms, step)]
+        self._params: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self._metrics: Dict[str, List[Tuple[str, float, int, int]]] = defaultdict(list)
+        self._pending = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._closed = False
+        self._overflowing = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="tracking-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> "TrackingWriter":
+        return cls(
+            flush_interval=float(os.getenv("TRACKING_FLUSH_INTERVAL", "2")),
+            max_queue=int(os.getenv("TRACKING_QUEUE_SIZE", "10000")),
+        )
+
+    # Producer side
+
+    def _put(self, item) -> bool:
+        if self._closed:
+            return False
+        try:
+            # Only the first value that finds the queue full waits; the next ones are dropped right away
+            # until the writer made room again
+            self._queue.put(item, block=not self._overflowing, timeout=self.put_timeout)
+            self._overflowing = False
+            return True
+        except queue.Full:
+            self._overflowing = True
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+
+    def log_params(self, run_id: str, params: Dict[str, Any]):
+        """Queue MLflow params of a run; values are converted to strings like mlflow.log_param does."""
+        for key, value in params.items():
+            self._put(("param", run_id, key, str(value)))
+
+    def log_metrics(self, run_id: str, metrics: Dict[str, Any], step: int = 0):
+        """Queue the numeric values of `metrics` for a run, timestamped now."""
+        timestamp = int(time.time() * 1000)
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self._put(("metric", run_id, key, float(value), timestamp, step))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far was delivered; False if that failed or timed out."""
+        marker = _Flush()
+        started = time.monotonic()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+        return marker.done.wait(remaining) and marker.delivered
+
+    def close(self, timeout: float = TRACKING_SHUTDOWN_TIMEOUT) -> bool:
+        """Flush everything (the final flush) and stop the writer thread."""
+        if self._closed:
+            return True
+        delivered = self.flush(timeout)
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=1.0)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=1.0)
+        return delivered
+
+    # Writer thread
+
+    def _mlflow_client(self):
+        if self._client is None:
+            if self.client_factory is not None:
+                self._client = self.client_factory()
+            else:
+                from mlflow.tracking import MlflowClient
+                self._client = MlflowClient()
+        return self._client
+
+    def _add(self, item):
+        kind, run_id = item[0], item[1]
+        if kind == "param":
+            if item[2] not in self._params[run_id]:
+                self._pending += 1
+            self._params[run_id][item[2]] = item[3]
+        else:
+            self._metrics[run_id].append(item[2:])
+            self._pending += 1
+
+    def _send(self) -> bool:
+        """Deliver all pending params and metrics; False when the server couldn't be reached."""
+        from mlflow.entities import Metric, Param
+
+        for run_id in list(set(self._params) | set(self._metrics)):
+            while self._params.get(run_id) or self._metrics.get(run_id):
+                params = list(self._params[run_id].items())[:MAX_PARAMS_PER_BATCH]
+                metrics = self._metrics[run_id][:MAX_VALUES_PER_BATCH - len(params)]
+                try:
+                    self._mlflow_client().log_batch(
+                        run_id,
+                        metrics=[Metric(key, value, timestamp, step) for key, value, timestamp, step in metrics],
+                        params=[Param(key, value) for key, value in params],
+                    )
+                    delivered = True
+                except Exception as e:
+                    if not is_permanent(e):
+                        print(f"Tracking server unavailable, keeping {self._pending} value(s) for later: {e}")
+                        return False
+                    delivered = False
+                    print(f"Tracking server rejected a batch of run {run_id}: {e}")
+
+                with self._lock:
+                    if delivered:
+                        self.stats["batches"] += 1
+                        self.stats["params"] += len(params)
+                        self.stats["metrics"] += len(metrics)
+                    else:
+                        self.stats["rejected"] += len(params) + len(metrics)
+                for key, _ in params:
+                    del self._params[run_id][key]
+                del self._metrics[run_id][:len(metrics)]
+                self._pending -= len(params) + len(metrics)
+            self._params.pop(run_id, None)
+            self._metrics.pop(run_id, None)
+        return True
+
+    def _try_send(self, force: bool = False) -> bool:
+        if not self._pending:
+            return True
+        if not force and time.monotonic() < self._retry_at:
+            return False
+        if self._send():
+            self._failures = 0
+            self._retry_at = 0.0
+            return True
+        self._failures += 1
+        with self._lock:
+            self.stats["retries"] += 1
+        self._retry_at = time.monotonic() + min(self.backoff_max, self.flush_interval * 2 ** self._failures)
+        return False
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            # While the server is down and the pending values are at their bound, stop draining the
+            # queue: producers then wait for room (and eventually drop) instead of memory growing
+            if self._pending >= self.max_pending:
+                time.sleep(max(0.0, min(self._retry_at, next_flush) - time.monotonic()))
+                self._try_send()
+                next_flush = time.monotonic() + self.flush_interval
+                continue
+
+            try:
+                item = self._queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                return
+            if isinstance(item, _Flush):
+                item.delivered = self._try_send(force=True)
+                item.done.set()
+            elif item is not False:
+                self._add(item)
+                if self._pending < MAX_VALUES_PER_BATCH:
+                    continue
+
+            if item is False or self._pending >= MAX_VALUES_PER_BATCH or time.monotonic() >= next_flush:
+                self._try_send()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def print_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        print(f"  {stats['params']} param(s) and {stats['metrics']} metric value(s) in {stats['batches']} batch(es), "
+              f"{stats['retries']} retries, {stats['rejected']} rejected, {stats['dropped']} dropped")
+
+
+class LangfuseBuffer:
+    """Backpressure and a final flush for Langfuse clients that upload in the background."""
+
+    def __init__(self, clients: Iterable[Any], max_pending: int = 10000, poll_interval: float = 0.05):
+        self.clients = list(clients)
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.stats = {"max_pending": 0, "waits": 0, "waited_s": 0.0}
+        self._closed = False
+        self._unsupported = False
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, clients: Iterable[Any]) -> "LangfuseBuffer":
+        return cls(clients, max_pending=int(os.getenv("LANGFUSE_MAX_PENDING", "10000")))
+
+    def pending(self) -> int:
+        """Events queued for upload in all clients (0 for clients whose queue can't be inspected)."""
+        total = 0
+        for client in self.clients:
+            # The SDK doesn't expose the size of its ingestion queue; this is the private queue of
+            # langfuse 2.x (pinned to <3 in pyproject.toml)
+            ingestion_queue = getattr(getattr(client, "task_manager", None), "_ingestion_queue", None)
+            qsize = getattr(ingestion_queue, "qsize", None)
+            if not callable(qsize):
+                if not self._unsupported:
+                    self._unsupported = True
+                    print("⚠️  Can't read the Langfuse upload queue of this SDK version; "
+                          "LANGFUSE_MAX_PENDING backpressure is disabled")
+                continue
+            total += qsize()
+        self.stats["max_pending"] = max(self.stats["max_pending"], total)
+        return total
+
+    async def wait_for_room(self):
+        """Return once fewer than max_pending events wait for upload."""
+        # Imported here so the thread-based entry points don't pay for asyncio at startup
+        import asyncio
+
+        if self.pending() < self.max_pending:
+            return
+        started = time.monotonic()
+        self.stats["waits"] += 1
+        while self.pending() >= self.max_pending:
+            await asyncio.sleep(self.poll_interval)
+        self.stats["waited_s"] += time.monotonic() - started
+
+    def close(self):
+        """Upload everything that is still queued; blocks until done."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        for client in self.clients:
+            try:
+                client.flush()
+            except Exception as e:
+                print(f"Final Langfuse flush failed: {e}")
+
+    def print_stats(self):
+        print(f"  up to {self.stats['max_pending']} event(s) queued for upload, held back {self.stats['waits']}x "
+              f"for {self.stats['waited_s']:.1f}s"
+              + (" (the upload queue of a client could not be read and was not counted)" if self._unsupported else ""))
+
+
+_writer: Optional[TrackingWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_tracking_writer() -> TrackingWriter:
+    """Process-wide writer configured from the environment; flushed when the process exits."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TrackingWriter.from_env()
+            atexit.register(_writer.close, TRACKING_SHUTDOWN_TIMEOUT)
+        return _writer
@@ -0,0 +1,365 @@
+"""
+Dedicated writer stage for the generated dataset.
+
+A single background thread owns the output file(s). Producers hand rows to it
+through a bounded queue, so concurrent generation never interleaves writes or
+reopens files. Data is fsynced in batches (every N rows or T seconds) and an
+optional `on_durable` callback is told which batches made it to disk, which the
+run manifest uses to record finished files.
+
+Supported formats:
+
+- "csv": one CSV file (the default, same layout as before)
+- "jsonl": `part-00000.jsonl`, `part-00001.jsonl`, ... shards in a directory
+- "parquet": `part-00000.parquet`, ... shards in a directory (requires pyarrow)
+"""
+
+import csv
+import json
+import os
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+FIELDNAMES = ['source_file', 'question', 'answer']
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+SHARD_RE = re.compile(r"^part-(\d{5})\.(jsonl|parquet)$")
+
+_STOP = object()
+
+
+def list_shards(directory: str, extension: str) -> List[Path]:
+    """Return the shard files of a sharded dataset, in shard order."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.iterdir()
+                  if SHARD_RE.match(path.name) and path.suffix == f".{extension}")
+
+
+def iter_dataset_rows(path: str, output_format: str = "csv") -> Iterator[Dict[str, str]]:
+    """Stream the rows of a dataset written by DatasetWriter."""
+    path = Path(path)
+    if output_format == "csv":
+        if path.exists():
+            with open(path, 'r', newline='', encoding='utf-8') as file:
+                yield from csv.DictReader(file)
+    elif output_format == "jsonl":
+        for shard in list_shards(path, "jsonl"):
+            with open(shard, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+    else:
+        import pyarrow.parquet as pq
+        for shard in list_shards(path, "parquet"):
+            for record_batch in pq.ParquetFile(shard).iter_batches(columns=FIELDNAMES):
+                yield from record_batch.to_pylist()
+
+
+def _shard_index(path: str) -> int:
+    match = SHARD_RE.match(Path(path).name)
+    if match is None:
+        raise ValueError(f"{path} is not a dataset shard (part-NNNNN.jsonl or part-NNNNN.parquet)")
+    return int(match.group(1))
+
+
+def _check_resume_position(position: Dict[str, Any], output: Path):
+    """Refuse a manifest position that points outside of the output being resumed (e.g. another format's)."""
+    path = Path(position["path"])
+    if path != output and path.parent != output:
+        raise ValueError(f"The manifest position {path} does not belong to the output {output}; "
+                         f"start a fresh run instead of resuming")
+
+
+def _fsync(file):
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class _CsvSink:
+    def __init__(self, path: Path, append: bool, resume_position: Optional[Dict[str, Any]]):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        if append and self.path.exists():
+            if resume_position is not None:
+                _check_resume_position(resume_position, self.path)
+                # Drop rows written after the last recorded position
+                with open(self.path, 'r+b') as file:
+                    file.truncate(resume_position["offset"])
+            # Without a recorded position nothing is known to be stale, so the file is kept as is
+            self.file = open(self.path, 'a', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        else:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+            self.writer.writeheader()
+
+    def write(self, rows: List[Dict[str, str]]) -> Dict[str, Any]:
+        self.writer.writerows(rows)
+        return {"path": str(self.path), "offset": self.file.tell()}
+
+    def sync(self) -> bool:
+        _fsync(self.file)
+        return True
+
+    def close(self):
+        _fsync(self.file)
+        self.file.close()
+
+
+class _ShardSink:
+    """Base class for directory-of-shards formats."""
+
+    extension = ""
+
+    def __init__(self, directory: Path, rows_per_shard: int, append: bool, resume_position: Optional[Dict[str, Any]]):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.rows_per_shard = rows_per_shard
+        self.shard_rows = 0
+
+        keep_up_to = -1
+        if append and resume_position is not None:
+            _check_resume_position(resume_position, self.directory)
+            if not resume_position["path"].endswith(f".{self.extension}"):
+                raise ValueError(f"The manifest position {resume_position['path']} is not a {self.extension} shard; "
+                                 f"start a fresh run instead of resuming")
+            keep_up_to = _shard_index(resume_position["path"])
+            self._truncate_resumed_shard(Path(resume_position["path"]), resume_position["offset"])
+        elif append:
+            # Without a recorded position nothing is known to be stale, so all shards are kept
+            keep_up_to = max((_shard_index(shard) for shard in list_shards(self.directory, self.extension)), default=-1)
+
+        # Remove shards that are not accounted for in the manifest (or all of them on a fresh run)
+        for shard in list_shards(self.directory, self.extension):
+            if _shard_index(shard) > keep_up_to:
+                shard.unlink()
+        self.shard_index = keep_up_to + 1
+
+    def _truncate_resumed_shard(self, path: Path, offset: int):
+        pass
+
+    def shard_path(self, index: int) -> Path:
+        return self.directory / f"part-{index:05d}.{self.extension}"
+
+
+class _JsonlShardSink(_ShardSink):
+    extension = "jsonl"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.file = None
+
+    def _truncate_resumed_shard(self, path: Path, offset: int):
+        if path.exists():
+            with open(path, 'r+b') as file:
+                file.truncate(offset)
+
+    def write(self, rows: List[Dict[str, str]]) -> Dict[str, Any]:
+        if self.file is None:
+            self.path = self.shard_path(self.shard_index)
+            self.file = open(self.path, 'w', encoding='utf-8')
+            self.shard_rows = 0
+
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.shard_rows += len(rows)
+        position = {"path": str(self.path), "offset": self.file.tell()}
+
+        # Rotate between batches so the rows of one source file never span two shards
+        if self.shard_rows >= self.rows_per_shard:
+            self.close()
+            self.shard_index += 1
+        return position
+
+    def sync(self) -> bool:
+        if self.file is not None:
+            _fsync(self.file)
+        return True
+
+    def close(self):
+        if self.file is not None:
+            _fsync(self.file)
+            self.file.close()
+            self.file = None
+
+
+class _ParquetShardSink(_ShardSink):
+    """Buffers rows in memory and writes each shard as a whole Parquet file."""
+
+    extension = "parquet"
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Writing Parquet shards requires pyarrow: pip install pyarrow") from e
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        super().__init__(*args, **kwargs)
+        self.buffer = {name: [] for name in FIELDNAMES}
+
+    def write(self, rows: List[Dict[str, str]]) -> Dict[str, Any]:
+        for row in rows:
+            for name in FIELDNAMES:
+                self.buffer[name].append(row[name])
+        self.shard_rows += len(rows)
+        position = {"path": str(self.shard_path(self.shard_index)), "offset": self.shard_rows}
+
+        if self.shard_rows >= self.rows_per_shard:
+            self._flush_shard()
+        return position
+
+    def _flush_shard(self):
+        if self.shard_rows == 0:
+            return
+        path = self.shard_path(self.shard_index)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        table = self.pa.table({name: self.pa.array(values, type=self.pa.string()) for name, values in self.buffer.items()})
+        self.pq.write_table(table, tmp_path)
+        with open(tmp_path, 'rb') as file:
+            os.fsync(file.fileno())
+        tmp_path.replace(path)
+
+        self.buffer = {name: [] for name in FIELDNAMES}
+        self.shard_rows = 0
+        self.shard_index += 1
+
+    def sync(self) -> bool:
+        # Buffered rows only become durable once their shard is written
+        return self.shard_rows == 0
+
+    def close(self):
+        self._flush_shard()
+
+
+class DatasetWriter:
+    """Single long-lived writer that owns the dataset output.
+
+    Usage:
+
+        with DatasetWriter(path, "csv", on_durable=callback) as writer:
+            writer.write(rows, tag=...)
+
+    `on_durable` is called from the writer thread with a list of
+    `(tag, position)` tuples once the corresponding rows are on disk, in the
+    order they were written. `position` identifies where the rows ended
+    (`{"path": ..., "offset": ...}`) and can be passed back as
+    `resume_position` to continue an interrupted run.
+    """
+
+    def __init__(self, path: str, output_format: str = "csv", rows_per_shard: int = 100000,
+                 fsync_rows: int = 1000, fsync_interval: float = 5.0,
+                 on_durable: Optional[Callable[[List[Tuple[Any, Dict[str, Any]]]], None]] = None,
+                 append: bool = False, resume_position: Optional[Dict[str, Any]] = None, max_queue: int = 1024):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+
+        self.path = Path(path)
+        self.output_format = output_format
+        self.fsync_rows = fsync_rows
+        self.fsync_interval = fsync_interval
+        self.on_durable = on_durable
+        self.rows_written = 0
+        self.syncs = 0
+
+        if output_format == "csv":
+            self._sink = _CsvSink(self.path, append, resume_position)
+        elif output_format == "jsonl":
+            self._sink = _JsonlShardSink(self.path, rows_per_shard, append, resume_position)
+        else:
+            self._sink = _ParquetShardSink(self.path, rows_per_shard, append, resume_position)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="dataset-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, rows: List[Dict[str, str]], tag: Any = None):
+        """Queue rows for writing; blocks when the queue is full (backpressure)."""
+        self._put((rows, tag))
+
+    async def awrite(self, rows: List[Dict[str, str]], tag: Any = None):
+        """write() for coroutines: queues without blocking, waiting for room in a worker thread when the queue is full."""
+        # Imported here so the synchronous entry points don't pay for asyncio at startup
+        import asyncio
+
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+        try:
+            self._queue.put_nowait((rows, tag))
+        except queue.Full:
+            await asyncio.to_thread(self._put, (rows, tag))
+
+    def close(self):
+        """Write everything that is queued, sync it to disk and stop the writer thread."""
+        if self._thread.is_alive():
+            self._put(_STOP)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+
+    def _put(self, item):
+        # Poll so producers don't block forever if the writer thread died
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Dataset writer failed") from self._error
+            try:
+                self._queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        unsynced = 0
+        last_sync = time.monotonic()
+        try:
+            while True:
+                timeout = max(self.fsync_interval - (time.monotonic() - last_sync), 0.01)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+                if item is not None:
+                    rows, tag = item
+                    position = self._sink.write(rows)
+                    self._pending.append((tag, position))
+                    self.rows_written += len(rows)
+                    unsynced += len(rows)
+
+                due = unsynced >= self.fsync_rows or time.monotonic() - last_sync >= self.fsync_interval
+                if self._pending and due and self._sink.sync():
+                    self._notify()
+                    unsynced = 0
+                    last_sync = time.monotonic()
+                elif not self._pending:
+                    last_sync = time.monotonic()
+
+            self._sink.close()
+            self._notify()
+        except BaseException as e:
+            self._error = e
+
+    def _notify(self):
+        self.syncs += 1
+        pending, self._pending = self._pending, []
+        if self.on_durable is not None and pending:
+            self.on_durable(pending)